@@ -7,17 +7,18 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_restful import Api
 from .extensions import db, bcrypt, ma, login_manager
+from config import build_config
 
 def create_app(config_class='config.DevelopmentConfig'):
     """Create and configure the Flask application"""
     app = Flask(__name__)
 
     # Load configuration
-    app.config.from_object(config_class)
+    app.config.from_mapping(build_config(config_class))
 
     # Override from environment variable if set
     if os.getenv('FLASK_CONFIG'):
-        app.config.from_object(os.getenv('FLASK_CONFIG'))
+        app.config.from_mapping(build_config(os.getenv('FLASK_CONFIG')))
 
     # Initialize extensions with app
     db.init_app(app)
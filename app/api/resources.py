@@ -1,5 +1,6 @@
 import uuid
 import time
+import traceback
 from datetime import datetime, timedelta
 from flask import request, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
@@ -7,7 +8,7 @@ from flask_restful import Resource
 from app.extensions import db, login_manager
 from app.model import ActivityLog, User, register_parser, user_schema, login_parser, UserSession, chat_parser, \
     feedback_parser, Feedback, activities_schema, search_parser, users_schema, activity_schema
-from app.chatbot import dialogue_manager, metrics_tracker, opac_client
+from app.chatbot import get_dialogue_manager, get_metrics_tracker, get_opac_client
 
 def get_client_info():
     return {
@@ -151,7 +152,7 @@ class ChatResource(Resource):
         start_time = time.time()
 
         try:
-            result = dialogue_manager.process_message(
+            result = get_dialogue_manager().process_message(
                 user_id=user_id,
                 session_id=session_id,
                 message=args['message']
@@ -171,7 +172,6 @@ class ChatResource(Resource):
             if not isinstance(result['confidence'], (int, float)):
                 result['confidence'] = 0.0
         except Exception as e:
-            import traceback
             traceback.print_exc()
             return {'error': 'Processing error', 'message': str(e)}, 500
 
@@ -185,14 +185,15 @@ class ChatResource(Resource):
                 'intent': result.get('intent', 'unknown')
             })
 
-        metrics_tracker.record_interaction(
+        get_metrics_tracker().record_interaction(
             user_id=user_id,
             session_id=session_id,
             message=args['message'],
             response=result['response'],
             response_time=response_time,
             confidence=result['confidence'],
-            method=result.get('processing_method', 'unknown')
+            method=result.get('processing_method', 'unknown'),
+            intent=result.get('intent', 'unknown')
         )
 
         return {
@@ -275,7 +276,7 @@ class BookSearchResource(Resource):
             })
 
         local_results = []
-        opac_results = opac_client.search(args['q'], args.get('author'), args.get('subject'))
+        opac_results = get_opac_client().search(args['q'], args.get('author'), args.get('subject'))
         results = local_results + opac_results
 
         return {
@@ -379,7 +380,7 @@ class AdminMetricsResource(Resource):
                 {'date': str(stat.date), 'chat_count': stat.chat_count}
                 for stat in chat_stats
             ],
-            'system_metrics': metrics_tracker.get_all_metrics(),
+            'system_metrics': get_metrics_tracker().get_all_metrics(),
             'total_users': User.query.count(),
             'total_activities': ActivityLog.query.count()
         }
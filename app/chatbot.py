@@ -1,16 +1,92 @@
-from app.models.dialogue_manager import DialogueManager
-from app.models.rule_engine import AdvancedRuleEngine
-from app.models.nlp_engine import HybridNLPEngine
-from app.models.response_generator import ResponseGenerator
-from app.utils.metrics import MetricsTracker
-from app.api.opac_client import OPACClient
-
-# Initialize components lazily or as singletons
-rule_engine = AdvancedRuleEngine('app/data/rules.json')
-nlp_engine = HybridNLPEngine()
-response_generator = ResponseGenerator('app/data/response_templates.json')
-metrics_tracker = MetricsTracker()
-opac_client = OPACClient()
-
-# Create dialogue manager
-dialogue_manager = DialogueManager(rule_engine, nlp_engine, response_generator)
+import threading
+
+# Components are built on first use rather than at import, so importing the API (or this module)
+# does not load the NLP models; each getter returns the same instance every time
+
+_instances = {}
+# Reentrant: building the dialogue manager builds the engines it wraps under the same lock
+_build_lock = threading.RLock()
+
+
+def _singleton(name, build):
+    """Return the component called name, building it exactly once even under concurrent first calls"""
+    instance = _instances.get(name)
+    if instance is None:
+        with _build_lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = build()
+    return instance
+
+
+def _build_rule_engine():
+    from app.models.rule_engine import AdvancedRuleEngine
+    return AdvancedRuleEngine('app/data/rules.json')
+
+
+def _build_nlp_engine():
+    from app.models.nlp_engine import HybridNLPEngine
+    return HybridNLPEngine()
+
+
+def _build_response_generator():
+    from app.models.response_generator import ResponseGenerator
+    return ResponseGenerator('app/data/response_templates.json')
+
+
+def _build_metrics_tracker():
+    from app.utils.metrics import MetricsTracker
+    return MetricsTracker()
+
+
+def _build_opac_client():
+    from app.api.opac_client import OPACClient
+    return OPACClient()
+
+
+def _build_dialogue_manager():
+    from app.models.dialogue_manager import DialogueManager
+    return DialogueManager(get_rule_engine(), get_nlp_engine(), get_response_generator())
+
+
+def get_rule_engine():
+    return _singleton('rule_engine', _build_rule_engine)
+
+
+def get_nlp_engine():
+    return _singleton('nlp_engine', _build_nlp_engine)
+
+
+def get_response_generator():
+    return _singleton('response_generator', _build_response_generator)
+
+
+def get_metrics_tracker():
+    return _singleton('metrics_tracker', _build_metrics_tracker)
+
+
+def get_opac_client():
+    return _singleton('opac_client', _build_opac_client)
+
+
+def get_dialogue_manager():
+    return _singleton('dialogue_manager', _build_dialogue_manager)
+
+
+_COMPONENTS = {
+    'rule_engine': get_rule_engine,
+    'nlp_engine': get_nlp_engine,
+    'response_generator': get_response_generator,
+    'metrics_tracker': get_metrics_tracker,
+    'opac_client': get_opac_client,
+    'dialogue_manager': get_dialogue_manager,
+}
+
+
+def __getattr__(name):
+    """Keep `from app.chatbot import dialogue_manager` and friends working (PEP 562)"""
+    getter = _COMPONENTS.get(name)
+    if getter is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Called outside any except block so a component's own KeyError etc. surfaces unchanged
+    return getter()
@@ -3,9 +3,18 @@ from datetime import datetime
 import uuid
 from flask_login import UserMixin
 from flask_restful import reqparse
+from sqlalchemy import DDL, event, func, literal_column
 from .extensions import db, ma, bcrypt
 
 
+def book_search_vector(title, author, topic):
+    """Postgres tsvector over a book's title, author and topic; the books_fts index is built on this expression"""
+    # Literals rather than bound parameters, so queries render the exact expression Postgres indexed
+    empty, space = literal_column("''"), literal_column("' '")
+    document = func.coalesce(title, empty) + space + func.coalesce(author, empty) + space + func.coalesce(topic, empty)
+    return func.to_tsvector(literal_column("'english'"), document)
+
+
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
 
@@ -59,6 +68,10 @@ class ActivityLog(db.Model):
     user_agent = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # A user's activity newest-first (get_user_activity, ActivityResource) is a range scan, not a sort
+    __table_args__ = (
+        db.Index('ix_activity_logs_user_ts', user_id, timestamp.desc()),
+    )
 
 
 class Feedback(db.Model):
@@ -85,6 +98,21 @@ class Book(db.Model):
     location = db.Column(db.String(100))
     summary = db.Column(db.Text)
 
+    # Postgres only: full-text index for search_catalog's query, and trigram indexes on the columns
+    # it still filters with ilike '%...%' so those become index scans instead of sequential scans
+    __table_args__ = (
+        db.Index('books_fts', book_search_vector(title, author, topic),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        *(
+            db.Index(f'books_{name}_trgm', column, postgresql_using='gin',
+                     postgresql_ops={name: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+            for name, column in (('author', author), ('topic', topic), ('isbn', isbn))
+        ),
+    )
+
+
+event.listen(Book.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 
 class Contact(db.Model):
     __tablename__ = 'contacts'
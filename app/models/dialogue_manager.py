@@ -1,10 +1,30 @@
 import datetime
 import json
+import time
 from enum import Enum
+from random import choice as _choice, sample as _sample
 from typing import Dict, List, Optional
 import redis  # For session management
 
 
+# Canned replies for _handle_low_confidence, one tuple per confidence band
+_CLARIFY_RESPONSES = (
+    "I'm not quite sure what you mean. Could you rephrase that?",
+    "I want to make sure I understand correctly. Could you say that differently?",
+    "I'm having trouble understanding. Could you provide more details?"
+)
+_SUGGEST_RESPONSES = (
+    "I think you might be asking about: (1) Library hours, (2) Finding books, or (3) Borrowing policies. Which one interests you?",
+    "Could this be about: Library hours, Book search, or Borrowing information?",
+    "I can help with library hours, book searches, or borrowing questions. Which would you like?"
+)
+_CONFIRM_TEMPLATES = (
+    "Just to make sure I understood: are you asking about '{message}'?",
+    "I think you're asking about: {message}. Is that correct?",
+    "Let me confirm: you want to know about '{message}', right?"
+)
+
+
 class ConversationState(Enum):
     GREETING = "greeting"
     QUERY_PROCESSING = "query_processing"
@@ -152,6 +172,7 @@ class DialogueManager:
             'response': final_response,
             'confidence': response_data.get('confidence', 0.0),
             'processing_method': processing_method,
+            'intent': intent,
             'suggested_follow_ups': follow_ups,
             'context_id': context_key
         }
@@ -196,37 +217,19 @@ class DialogueManager:
         # Different strategies based on confidence level
         if conf_value < 0.3:
             # Very low confidence - ask for clarification
-            responses = [
-                "I'm not quite sure what you mean. Could you rephrase that?",
-                "I want to make sure I understand correctly. Could you say that differently?",
-                "I'm having trouble understanding. Could you provide more details?"
-            ]
-            import random
-            response = random.choice(responses)
+            response = _choice(_CLARIFY_RESPONSES)
             action = 'clarify'
             processing_method = 'low_confidence_clarification'  # ADD THIS
 
         elif conf_value < 0.5:
             # Medium-low confidence - offer suggestions
-            responses = [
-                "I think you might be asking about: (1) Library hours, (2) Finding books, or (3) Borrowing policies. Which one interests you?",
-                "Could this be about: Library hours, Book search, or Borrowing information?",
-                "I can help with library hours, book searches, or borrowing questions. Which would you like?"
-            ]
-            import random
-            response = random.choice(responses)
+            response = _choice(_SUGGEST_RESPONSES)
             action = 'suggest'
             processing_method = 'medium_confidence_suggestion'  # ADD THIS
 
         else:
             # Confidence is okay, but we still want to verify
-            responses = [
-                f"Just to make sure I understood: are you asking about '{user_message}'?",
-                f"I think you're asking about: {user_message}. Is that correct?",
-                f"Let me confirm: you want to know about '{user_message}', right?"
-            ]
-            import random
-            response = random.choice(responses)
+            response = _choice(_CONFIRM_TEMPLATES).format(message=user_message)
             action = 'confirm'
             processing_method = 'high_confidence_confirmation'  # ADD THIS
 
@@ -404,9 +407,6 @@ class DialogueManager:
         if context is None:
             context = {}
 
-        import time
-        import json
-
         log_entry = {
             'timestamp': time.time(),
             'datetime': time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -563,8 +563,7 @@ class DialogueManager:
             suggestions = ["Yes, that's correct", "No, let me clarify", "Partly, but also..."]
 
         # Limit to 3-4 suggestions
-        import random
         if len(suggestions) > 4:
-            suggestions = random.sample(suggestions, 4)
+            suggestions = _sample(suggestions, 4)
 
         return suggestions
@@ -1,46 +1,85 @@
+import json
+import os
 import re
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
 
 import spacy
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sentence_transformers import SentenceTransformer
 from typing import Dict, List, Tuple, Any
 import joblib
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Lookup tables shared by every request, built once at import
+_POSITIVE_WORDS = ('good', 'great', 'excellent', 'thank', 'thanks', 'helpful', 'nice')
+_NEGATIVE_WORDS = ('bad', 'poor', 'terrible', 'wrong', 'incorrect', 'problem')
+
+_STOPWORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'})
+
+# Compiled once per entity type; each is scanned separately so overlapping entities are all reported
+_ENTITY_PATTERNS = tuple((entity_type, re.compile(pattern, re.IGNORECASE)) for entity_type, pattern in (
+    # Book-related entities
+    ('book_title', r'book (?:called|titled|named) ["\'](.+?)["\']'),
+    ('author', r'by (\w+(?:\s+\w+)*)'),
+    ('isbn', r'ISBN(?:\s+)?(\d{10}|\d{13})'),
+    ('genre', r'(fiction|non-fiction|science fiction|fantasy|mystery|biography|textbook)'),
+    # Library-related entities
+    ('library_section', r'(reference|circulation|periodicals|archives|digital lab)'),
+    ('service', r'(borrow|return|renew|reserve|interlibrary loan)'),
+    ('duration', r'(\d+)\s+(day|week|month)s?'),
+    ('time', r'(\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM))'),
+))
+
+
+def _configure_torch(torch) -> None:
+    """Tune torch for multi-core CPU inference before the SBERT model is built"""
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Only settable once, before any inter-op work has started
+        pass
+    torch.backends.mkldnn.enabled = True
 
-class HybridNLPEngine:
-    def __init__(self):
-        print("🚀 Initializing Hybrid NLP Engine...")
 
-        # Load spaCy
-        try:
-            self.spacy_nlp = spacy.load("en_core_web_sm")
-            print("✅ spaCy model loaded")
-        except:
-            print("⚠️ Could not load spaCy model, please run: python -m spacy download en_core_web_sm")
-            self.spacy_nlp = None
+@dataclass(frozen=True)
+class NormalizedText:
+    """Canonical forms of one request's text, computed once and shared by the pipeline"""
+    raw: str
+    lower: str
+    tokens: List[str]
+    token_set: frozenset
+    byte_lower: bytes
 
-        # Load trained models if they exist
-        self.vectorizer = None
-        self.intent_classifier = None
+    @classmethod
+    def from_text(cls, text: str) -> 'NormalizedText':
+        raw = text.strip()
+        lower = raw.lower()
+        tokens = lower.split()
+        return cls(raw, lower, tokens, frozenset(tokens), lower.encode('utf-8'))
 
-        try:
-            self.vectorizer = joblib.load('app/models/tfidf_vectorizer.pkl')
-            self.intent_classifier = joblib.load('app/models/intent_classifier.pkl')
-            print("✅ Trained models loaded")
-        except FileNotFoundError:
-            print("⚠️ Trained model files not found")
-            print("📝 Please run: python train_models.py")
-            print("📝 Using keyword-based intent detection for now")
 
-        # Load SentenceTransformer if available
-        try:
-            from sentence_transformers import SentenceTransformer
-            self.sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
-            print("✅ SentenceTransformer loaded")
-        except ImportError:
-            print("⚠️ SentenceTransformer not available")
-            self.sbert_model = None
+class HybridNLPEngine:
+    KB_FILE = 'app/data/knowledge_base.json'
+    KB_MATCH_THRESHOLD = 0.6
+    # Below this many questions a flat index is both exact and fast enough
+    KB_IVFPQ_MIN_SIZE = 64 * 39
+
+    def __init__(self):
+        print("🚀 Initializing Hybrid NLP Engine...")
+
+        # Load spaCy and the trained models concurrently; SentenceTransformer
+        # is loaded on first use (see sbert_model)
+        executor = ThreadPoolExecutor(max_workers=2)
+        spacy_future = executor.submit(self._load_spacy)
+        models_future = executor.submit(self._load_trained_models)
 
         # Intent examples for keyword matching (fallback)
         self.intent_examples = {
@@ -62,74 +101,146 @@ class HybridNLPEngine:
 
         # Also add library_keywords for the other method
         self.library_keywords = self.library_intents  # Use same dictionary
+        self._intent_kw_lens = {intent: len(kws) for intent, kws in self.library_intents.items()}
+        # Byte-string keywords: bytes.__contains__ skips per-character decoding
+        self._intent_kw_bytes = {intent: [kw.encode('utf-8') for kw in kws]
+                                 for intent, kws in self.library_intents.items()}
+
+        # SBERT embeddings of the intent examples, built on first use
+        self._all_examples_mat = None
+        self._example_intents = []
+        self._example_offsets = None
+        self._inference_mode = nullcontext
+
+        # Knowledge-base semantic search index, built on first use
+        self._kb_index = None
+        self._kb_embeddings = None
+        self._kb_texts = []
+        self._kb_answers = []
+
+        self.spacy_nlp = spacy_future.result()
+        self.vectorizer, self.intent_classifier = models_future.result()
+        executor.shutdown()
+
+    @staticmethod
+    def _load_spacy():
+        """Load the spaCy pipeline, or None if the model is not installed"""
+        try:
+            nlp = spacy.load("en_core_web_sm")
+            print("✅ spaCy model loaded")
+            return nlp
+        except Exception:
+            print("⚠️ Could not load spaCy model, please run: python -m spacy download en_core_web_sm")
+            return None
+
+    @staticmethod
+    def _load_trained_models() -> Tuple[Any, Any]:
+        """Load the trained vectorizer and intent classifier if they exist"""
+        try:
+            vectorizer = joblib.load('app/models/tfidf_vectorizer.pkl')
+            # Saved uncompressed by train_model.py; its arrays are paged in from disk on use
+            intent_classifier = joblib.load('app/models/intent_classifier.pkl', mmap_mode='r')
+            print("✅ Trained models loaded")
+            return vectorizer, intent_classifier
+        except FileNotFoundError:
+            print("⚠️ Trained model files not found")
+            print("📝 Please run: python train_models.py")
+            print("📝 Using keyword-based intent detection for now")
+            return None, None
+
+    @cached_property
+    def sbert_model(self):
+        """SentenceTransformer, loaded on first use so keyword-only paths never pay for it"""
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            _configure_torch(torch)
+            model = SentenceTransformer('all-MiniLM-L6-v2')
+            model.eval()
+            self._inference_mode = torch.inference_mode
+            print("✅ SentenceTransformer loaded")
+            return model
+        except ImportError:
+            print("⚠️ SentenceTransformer not available")
+            return None
 
-        # Load trained models if they exist
-        # self.vectorizer = None
-        # self.intent_classifier = None
+    def _encode(self, texts, **kwargs):
+        """Encode with SBERT, skipping autograd bookkeeping"""
+        model = self.sbert_model
+        with self._inference_mode():
+            return model.encode(texts, **kwargs)
 
     def process(self, text: str) -> Dict[str, Any]:
         """
         Process text through the hybrid NLP pipeline
         Returns: Dict with text, intent, entities, confidence, etc.
         """
-        # Clean and normalize text
-        text = text.lower().strip()
+        # Clean and normalize text once for every stage below
+        norm = NormalizedText.from_text(text)
 
         # Get spaCy analysis
-        doc = self.spacy_nlp(text) if self.spacy_nlp else None
+        doc = self.spacy_nlp(norm.lower) if self.spacy_nlp else None
 
         # Extract entities using multiple methods
-        entities = self._extract_entities(doc)
+        entities = self._extract_all_entities(doc, norm)
 
         # Classify intent using hybrid approach
-        intent, confidence = self._classify_intent_simple(text)
+        intent, confidence = self._classify_intent_simple(norm)
 
         # Analyze sentiment
-        sentiment = self._analyze_sentiment(text)
+        sentiment = self._analyze_sentiment(norm)
 
         # Extract keywords
-        keywords = self._extract_keywords(text)
+        keywords = self._extract_keywords(norm, doc)
 
         return {
-            'text': text,
-            'original_text': text,
+            'text': norm.lower,
+            'original_text': norm.raw,
             'intent': intent,
             'confidence': float(confidence),
             'entities': entities,
             'sentiment': sentiment,
             'keywords': keywords,
-            'tokens': [token.text for token in doc],
+            'tokens': [token.text for token in doc] if doc is not None else norm.tokens,
             'processed': True
         }
 
-    def _extract_entities(self, doc) -> List[Dict]:
-        """Extract entities using spaCy and custom rules"""
-        entities = []
+    def _extract_all_entities(self, doc, norm: NormalizedText = None) -> List[Dict]:
+        """Extract spaCy and custom library entities in one pass, cached on the Doc"""
+        if doc is not None:
+            cached = doc.user_data.get('library_entities')
+            if cached is not None:
+                return list(cached)
+        if norm is None:
+            norm = NormalizedText.from_text(doc.text)
 
         # spaCy named entities
-        for ent in doc.ents:
-            entities.append({
-                'text': ent.text,
-                'label': ent.label_,
-                'type': 'spacy',
-                'start': ent.start_char,
-                'end': ent.end_char
-            })
+        entities = [{
+            'text': ent.text,
+            'label': ent.label_,
+            'type': 'spacy',
+            'start': ent.start_char,
+            'end': ent.end_char
+        } for ent in (doc.ents if doc is not None else ())]
 
         # Custom library entities
-        custom_entities = self._extract_custom_entities(doc.text)
-        entities.extend(custom_entities)
+        entities.extend(self._extract_custom_entities(norm))
 
+        if doc is not None:
+            doc.user_data['library_entities'] = entities
+            return list(entities)
         return entities
 
     def analyze(self, text: str, context: Dict = None) -> Dict:
         """Advanced NLP analysis with multiple techniques"""
 
+        norm = NormalizedText.from_text(text)
+
         # 1. SpaCy processing
         doc = self.spacy_nlp(text)
 
         # 2. Entity extraction
-        entities = self._extract_library_entities(doc)
+        entities = self._extract_all_entities(doc, norm)
 
         # 3. Intent classification (multiple methods)
         intent_scores = self._classify_intent_ensemble(text)
@@ -138,7 +249,7 @@ class HybridNLPEngine:
         kb_similarity = self._find_kb_match(text)
 
         # 5. Sentiment analysis
-        sentiment = self._analyze_sentiment(text)
+        sentiment = self._analyze_sentiment(norm)
 
         return {
             'text': text,
@@ -154,31 +265,15 @@ class HybridNLPEngine:
             'requires_clarification': self._needs_clarification(entities, intent_scores)
         }
 
-    def _extract_library_entities(self, doc) -> List[Dict]:
-        """Extract library-specific entities"""
-        entities = []
-
-        for ent in doc.ents:
-            entities.append({
-                'text': ent.text,
-                'label': ent.label_,
-                'start': ent.start_char,
-                'end': ent.end_char
-            })
-
-        # Custom entity extraction for library context
-        library_entities = self._extract_custom_entities(doc)
-        entities.extend(library_entities)
-
-        return entities
-
     def _classify_intent_ensemble(self, text: str) -> Dict[str, float]:
         """Use multiple models for intent classification"""
         scores = {}
 
         # Method 1: Rule-based pattern matching
-        for intent, keywords in self.library_intents.items():
-            score = sum(1 for kw in keywords if kw in text.lower()) / len(keywords)
+        text_bytes = text.lower().encode('utf-8')
+        kw_lens = self._intent_kw_lens
+        for intent, keywords in self._intent_kw_bytes.items():
+            score = sum(1 for kw in keywords if kw in text_bytes) / kw_lens[intent]
             scores[intent] = score * 0.3  # Weight
 
         # Method 2: TF-IDF + Classifier
@@ -188,19 +283,103 @@ class HybridNLPEngine:
             scores[intent] = scores.get(intent, 0) + (classifier_scores[i] * 0.5)
 
         # Method 3: Semantic similarity with SBERT
-        query_embedding = self.sbert_model.encode(text)
-        # Compare with predefined intent examples
-        for intent, examples in self.intent_examples.items():
-            example_embeddings = self.sbert_model.encode(examples)
-            similarities = np.dot(example_embeddings, query_embedding)
-            scores[intent] = scores.get(intent, 0) + (np.max(similarities) * 0.2)
+        if self.sbert_model is not None:
+            examples_mat = self._get_examples_matrix()
+            query_embedding = self._encode(text, normalize_embeddings=True).astype(np.float16)
+            # One matmul against every example, then the best example per intent
+            similarities = (examples_mat @ query_embedding).astype(np.float32)
+            best_per_intent = np.maximum.reduceat(similarities, self._example_offsets)
+            for intent, similarity in zip(self._example_intents, best_per_intent):
+                scores[intent] = scores.get(intent, 0) + (float(similarity) * 0.2)
 
         return scores
 
+    def _get_examples_matrix(self) -> np.ndarray:
+        """Encode all intent examples once and cache them as a single FP16 matrix"""
+        if self._all_examples_mat is None:
+            intents, offsets, examples = [], [], []
+            for intent, intent_examples in self.intent_examples.items():
+                intents.append(intent)
+                offsets.append(len(examples))
+                examples.extend(intent_examples)
+
+            examples_mat = self._encode(examples, normalize_embeddings=True)
+            self._example_intents = intents
+            self._example_offsets = np.asarray(offsets)
+            self._all_examples_mat = np.asarray(examples_mat).astype(np.float16)
+
+        return self._all_examples_mat
+
     def _find_kb_match(self, query: str) -> Dict:
         """Find similar questions in knowledge base"""
-        # Implement semantic search using FAISS or similar
-        pass
+        no_match = {
+            'similarity': 0.0,
+            'match_found': False,
+            'best_match': None
+        }
+
+        if self.sbert_model is None or not self._build_kb_index():
+            return no_match
+
+        query_embedding = self._encode(query, normalize_embeddings=True)
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+
+        if self._kb_index is not None:
+            distances, indices = self._kb_index.search(query_embedding, 1)
+            best = int(indices[0, 0])
+            if best < 0:
+                return no_match
+            # Squared L2 between unit vectors -> cosine similarity
+            similarity = float(1 - distances[0, 0] / 2)
+        else:
+            similarities = self._kb_embeddings @ query_embedding[0]
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+        return {
+            'similarity': similarity,
+            'match_found': similarity >= self.KB_MATCH_THRESHOLD,
+            'best_match': self._kb_texts[best],
+            'answer': self._kb_answers[best]
+        }
+
+    def _build_kb_index(self) -> bool:
+        """Embed the knowledge-base questions and build the search index once"""
+        if self._kb_embeddings is not None:
+            return len(self._kb_texts) > 0
+
+        try:
+            with open(self.KB_FILE, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', [])
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not load knowledge base: {e}")
+            entries = []
+
+        for entry in entries:
+            for question in entry.get('questions', []):
+                self._kb_texts.append(question)
+                self._kb_answers.append(entry.get('answer'))
+
+        if not self._kb_texts:
+            self._kb_embeddings = np.empty((0, 0), dtype=np.float32)
+            return False
+
+        embeddings = self._encode(self._kb_texts, normalize_embeddings=True)
+        self._kb_embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        if faiss is not None:
+            dim = self._kb_embeddings.shape[1]
+            if len(self._kb_texts) >= self.KB_IVFPQ_MIN_SIZE:
+                # IVF-PQ needs enough vectors to train its coarse and PQ codebooks
+                quantizer = faiss.IndexFlatL2(dim)
+                self._kb_index = faiss.IndexIVFPQ(quantizer, dim, 64, 16, 8)
+                self._kb_index.train(self._kb_embeddings)
+            else:
+                self._kb_index = faiss.IndexFlatL2(dim)
+            self._kb_index.add(self._kb_embeddings)
+
+        print(f"✅ Knowledge base indexed ({len(self._kb_texts)} questions)")
+        return True
 
     def _classify_intent(self, text: str, doc) -> tuple:
         """Classify intent using rule-based and ML approaches"""
@@ -240,37 +419,16 @@ class HybridNLPEngine:
         # Default to unknown
         return 'unknown', 0.5
 
-    def _extract_custom_entities(self, text):
+    def _extract_custom_entities(self, norm: NormalizedText):
         """
         Extract custom entities from text using rule-based patterns
         """
         entities = []
-
-        if hasattr(text, 'text'):
-            text_str = text.text  # This is a spaCy Doc object
-        else:
-            text_str = str(text)  # Convert to string
-
-        # Book-related entities
-        book_patterns = {
-            'book_title': r'book (?:called|titled|named) ["\'](.+?)["\']',
-            'author': r'by (\w+(?:\s+\w+)*)',
-            'isbn': r'ISBN(?:\s+)?(\d{10}|\d{13})',
-            'genre': r'(fiction|non-fiction|science fiction|fantasy|mystery|biography|textbook)',
-        }
-
-        # Library-related entities
-        library_patterns = {
-            'library_section': r'(reference|circulation|periodicals|archives|digital lab)',
-            'service': r'(borrow|return|renew|reserve|interlibrary loan)',
-            'duration': r'(\d+)\s+(day|week|month)s?',
-            'time': r'(\d{1,2}(?::\d{2})?\s*(?:am|pm|AM|PM))',
-        }
+        text_str = norm.raw
 
         # Search patterns
-        for entity_type, pattern in {**book_patterns, **library_patterns}.items():
-            matches = re.finditer(pattern, text_str, re.IGNORECASE)
-            for match in matches:
+        for entity_type, pattern in _ENTITY_PATTERNS:
+            for match in pattern.finditer(text_str):
                 entities.append({
                     'type': entity_type,
                     'value': match.group(1),
@@ -280,13 +438,11 @@ class HybridNLPEngine:
 
         return entities
 
-    def _analyze_sentiment(self, text: str) -> str:
+    def _analyze_sentiment(self, norm: NormalizedText) -> str:
         """Simple sentiment analysis"""
-        positive_words = ['good', 'great', 'excellent', 'thank', 'thanks', 'helpful', 'nice']
-        negative_words = ['bad', 'poor', 'terrible', 'wrong', 'incorrect', 'problem']
-
-        pos_count = sum(1 for word in positive_words if word in text)
-        neg_count = sum(1 for word in negative_words if word in text)
+        text = norm.lower
+        pos_count = sum(1 for word in _POSITIVE_WORDS if word in text)
+        neg_count = sum(1 for word in _NEGATIVE_WORDS if word in text)
 
         if pos_count > neg_count:
             return 'positive'
@@ -295,23 +451,21 @@ class HybridNLPEngine:
         else:
             return 'neutral'
 
-    def _extract_keywords(self, text: str) -> List[str]:
-        """Extract important keywords"""
-        if self.spacy_nlp:
-            doc = self.spacy_nlp(text)
+    def _extract_keywords(self, norm: NormalizedText, doc=None) -> List[str]:
+        """Extract important keywords, reusing the caller's spaCy Doc if there is one"""
+        if doc is not None:
             keywords = [token.text for token in doc if not token.is_stop and not token.is_punct]
         else:
             # Simple split-based extraction
-            words = text.lower().split()
-            stopwords = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
-            keywords = [word for word in words if word not in stopwords and len(word) > 2]
+            keywords = [word for word in norm.tokens if word not in _STOPWORDS and len(word) > 2]
 
-        return list(set(keywords))
+        # Dedupe while keeping the order the keywords appear in
+        return list(dict.fromkeys(keywords))
 
     def get_similarity(self, text1: str, text2: str) -> float:
         """Get semantic similarity between two texts"""
-        embedding1 = self.sentence_transformer.encode(text1)
-        embedding2 = self.sentence_transformer.encode(text2)
+        embedding1 = self._encode(text1)
+        embedding2 = self._encode(text2)
 
         # Cosine similarity
         similarity = np.dot(embedding1, embedding2) / (
@@ -355,29 +509,21 @@ class HybridNLPEngine:
 
         return False
 
-    def _find_kb_match(self, query: str) -> Dict:
-        """Find similar questions in knowledge base (dummy implementation)"""
-        return {
-            'similarity': 0.0,
-            'match_found': False,
-            'best_match': None
-        }
-
-    def _classify_intent_simple(self, text: str) -> tuple:
+    def _classify_intent_simple(self, norm: NormalizedText) -> tuple:
         """Simple intent classification using keywords"""
-        if not text:
+        if not norm.lower:
             return 'unknown', 0.0
 
-        text_lower = text.lower()
+        text_bytes = norm.byte_lower
 
         # Check for each intent
         best_intent = 'unknown'
         max_score = 0.3
 
-        for intent, keywords in self.library_intents.items():
+        for intent, keywords in self._intent_kw_bytes.items():
             score = 0
             for kw in keywords:
-                if kw in text_lower:
+                if kw in text_bytes:
                     score += 0.4
 
             if score > max_score:
@@ -385,22 +531,22 @@ class HybridNLPEngine:
                 best_intent = intent
 
         # Overrides for better accuracy
-        if any(word in text_lower for word in ['hour', 'open', 'close', 'time']):
-            if 'library hour' in text_lower: return 'library_hours', 0.95
+        if any(word in text_bytes for word in (b'hour', b'open', b'close', b'time')):
+            if b'library hour' in text_bytes: return 'library_hours', 0.95
             best_intent, max_score = 'library_hours', max(max_score, 0.85)
 
-        if any(word in text_lower for word in ['book', 'find', 'search']):
-            if 'available' in text_lower: return 'book_availability', 0.9
+        if any(word in text_bytes for word in (b'book', b'find', b'search')):
+            if b'available' in text_bytes: return 'book_availability', 0.9
             best_intent, max_score = 'book_search', max(max_score, 0.8)
 
-        if any(word in text_lower for word in ['renew']): return 'book_renewal', 0.9
-        if any(word in text_lower for word in ['reserve', 'hold']): return 'book_reservation', 0.9
+        if b'renew' in text_bytes: return 'book_renewal', 0.9
+        if any(word in text_bytes for word in (b'reserve', b'hold')): return 'book_reservation', 0.9
 
-        if any(word in text_lower for word in ['contact', 'phone', 'email']): return 'contact_info', 0.9
+        if any(word in text_bytes for word in (b'contact', b'phone', b'email')): return 'contact_info', 0.9
 
-        if any(word in text_lower for word in ['research', 'citation', 'paper']): return 'research_assistance', 0.85
+        if any(word in text_bytes for word in (b'research', b'citation', b'paper')): return 'research_assistance', 0.85
 
-        if any(word in text_lower for word in ['hello', 'hi', 'hey', 'greeting', 'morning', 'afternoon', 'evening']):
+        if any(word in text_bytes for word in (b'hello', b'hi', b'hey', b'greeting', b'morning', b'afternoon', b'evening')):
             return 'greeting', 0.9
 
         return best_intent, min(max_score, 0.95)
\ No newline at end of file
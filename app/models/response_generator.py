@@ -1,108 +1,338 @@
 import json, os
+import logging
+import mmap
+import pickle
 import re
-from typing import Dict, Optional, List
+import sys
+import time
+import unicodedata
+from typing import Dict, Optional
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import orjson
+    _LOADS = orjson.loads
+except ImportError:
+    orjson = None
+    _LOADS = json.loads
+
+logger = logging.getLogger(__name__)
+
+
+# Mojibake left behind when UTF-8 text is decoded as cp1252/latin-1. Keys are full
+# multi-character sequences so a legitimate accented character is never rewritten on its own.
+_MOJIBAKE_PAIRS = (
+    ('â€¢', '•'), ('â€”', '—'), ('â€“', '–'), ('â€"', '—'), ('â€™', "'"), ('â€˜', "'"),
+    ('â€œ', '"'), ('â€\x9d', '"'), ('â€', '"'),
+    ('Ã©', 'é'), ('Ã¨', 'è'), ('Ã¢', 'â'), ('Ã\xa0', 'à'), ('Ã±', 'ñ'), ('Ã³', 'ó'),
+    ('Ãº', 'ú'), ('Ã¶', 'ö'), ('Ã¼', 'ü'), ('ÃŸ', 'ß'), ('Ã¦', 'æ'), ('Ã¸', 'ø'), ('Ã¥', 'å'),
+    ('\ud83d\udcd6', '📚'), ('\ud83d\udc4b', '👋'),
+)
+# Extra fix-ups applied to generated responses on top of _MOJIBAKE_PAIRS. fix.py strips
+# bytes 0x80-0x9F, which leaves '📚' as a bare 'ð' and '•' as 'â¢' in cleaned data files.
+_RESPONSE_FIX_PAIRS = (('ðŸ“š', '📚'), ('ð', '📚'), ('â¢', '•'))
+
+_RESPONSE_FIX_MAP = dict(_MOJIBAKE_PAIRS + _RESPONSE_FIX_PAIRS)
+assert len(_RESPONSE_FIX_MAP) == len(_MOJIBAKE_PAIRS) + len(_RESPONSE_FIX_PAIRS), "duplicate response fix key"
+
+
+def _alternation(keys) -> re.Pattern:
+    """Compile keys into one regex, longest first so prefixes can't shadow longer sequences"""
+    if not keys:
+        return re.compile('(?!)')
+    return re.compile('|'.join(re.escape(k) for k in sorted(keys, key=len, reverse=True)))
+
+
+def _split_fixes(mapping: Dict[str, str]) -> tuple:
+    """
+    Split a fix map into a str.translate table and a regex for everything else.
+    Single characters go to the table unless a multi-character key contains them,
+    since the table runs after the regex and would break those sequences up.
+    """
+    multi = [k for k in mapping if len(k) > 1]
+    single = {k: v for k, v in mapping.items() if len(k) == 1 and not any(k in m for m in multi)}
+    return str.maketrans(single), _alternation([k for k in mapping if k not in single])
+
+
+_RESPONSE_FIX_TABLE, _RESPONSE_FIX_RE = _split_fixes(_RESPONSE_FIX_MAP)
+
+# Methods whose responses carry text from outside the templates (rules, KB answers)
+_EXTERNAL_TEXT_METHODS = frozenset(('rule_based', 'knowledge_base'))
+
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+# Encodings tried in order when reading data files. latin-1 decodes any byte
+# sequence, so it must come last or cp1252 would never be reached.
+_FILE_ENCODINGS = ('utf-8-sig', 'utf-8', 'cp1252', 'latin-1')
+
+# Bump when load-time cleaning changes so stale template caches are reparsed
+_TEMPLATE_CACHE_VERSION = 3
+
+# Lone or paired UTF-16 surrogates, which can't be encoded as UTF-8
+_SURROGATE_RE = re.compile('[\ud800-\udfff]')
+
+# {placeholder} fields in response templates
+_TEMPLATE_VAR_RE = re.compile(r'\{(\w+)\}')
+
+# (key field, value field) layouts entity dicts come in, in order of preference
+_ENTITY_SHAPES = (('label', 'text'), ('entity', 'value'), ('type', 'value'))
+
+
+def _now_state() -> tuple:
+    """(epoch second, hour, formatted time) for now, refreshed at most once per second"""
+    state = _now_state.cached
+    sec = int(time.time())
+    if sec != state[0]:
+        now = datetime.fromtimestamp(sec)
+        # One tuple swap so concurrent readers never see mismatched fields
+        state = _now_state.cached = (sec, now.hour, now.strftime("%Y-%m-%d %H:%M:%S"))
+    return state
+
+
+_now_state.cached = (-1, 0, '')
+
+
+def _cached_now() -> str:
+    """Current local time as 'YYYY-mm-dd HH:MM:SS', formatted at most once per second"""
+    return _now_state()[2]
+
+
+def _detect_shape(entity) -> Optional[tuple]:
+    """Return the (key field, value field) pair an entity dict uses, or None"""
+    if isinstance(entity, dict):
+        for kf, vf in _ENTITY_SHAPES:
+            if kf in entity and vf in entity:
+                return kf, vf
+    return None
+
+
+def _fix_response(match) -> str:
+    return _RESPONSE_FIX_MAP[match.group(0)]
+
+
+# Built-in templates, overridden per intent by the templates file
+_DEFAULT_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "greeting": {
+        "main": "👋 **Hello! I'm the Babcock University Library Assistant.** \n\nI can help you with:\n• 📚 Finding books and resources\n• 🕐 Library hours and policies  \n• 🔍 Research and database access\n• 📝 Citations and references\n• 📞 Contact information\n\n**How can I assist you today?** Try asking:\n'What are the library hours?'\n'Find books about computer science'\n'How do I renew a book?'\n'Help with my research paper'",
+        "follow_up": ""
+    },
+    "book_search": {
+        "main": "📚 **BOOKS FOUND ({count})**\n\n{book_list}",
+        "no_results": "❌ That book isn't in our catalog. Would you like to:\n1. Try different search terms?\n2. Request an inter-library loan?\n3. Check eBook alternatives?",
+        "follow_up": "Need help locating any of these?"
+    },
+    "library_hours": {
+        "main": "🕐 **LIBRARY HOURS**\n\nWeekdays: **8:00 AM - 10:00 PM**\nWeekends: **10:00 AM - 8:00 PM**\n\n• Exam Period: 7:00 AM - 12:00 AM\n• Holidays: Closed\n\n_Current time: {current_time}_",
+        "follow_up": "Would you like to know about holiday schedules?"
+    },
+    "borrowing_policy": {
+        "main": "ℹ️ **BORROWING POLICY**\n\n**Students:**\n• Maximum books: **5**\n• Loan period: **14 days**\n• Renewals: **1 renewal** (if no holds)\n\n**Staff/Faculty:**\n• Maximum books: **10**\n• Loan period: **30 days**\n• Renewals: **2 renewals**\n\n**Overdue Fines:** ₦50 per day per book",
+        "follow_up": "Need to know how to renew your books?"
+    },
+    "contact_info": {
+        "main": "📞 **CONTACT INFORMATION**\n\n{contact_list}",
+        "follow_up": "Is there a specific department you're trying to reach?"
+    },
+    "research_assistance": {
+        "main": "🔍 **RESEARCH ASSISTANCE**\n\nI can help you find papers, databases, and guide you with citations.\n\n**Key Databases:**\n• JSTOR\n• IEEE Xplore\n• ScienceDirect\n\n**Tips:**\n• Use specific keywords\n• Check our citation guides for APA/MLA",
+        "follow_up": "What is your research topic?"
+    },
+    "book_renewal": {
+        "main": "📚 **BOOK RENEWAL**\n\nYou can renew books through your online account or at the circulation desk.\n\n**Policy:**\n• **1 renewal** for students\n• **2 renewals** for staff/faculty\n• Renewal is only possible if there are no active holds on the book.",
+        "follow_up": "Would you like me to check your borrowed books?"
+    },
+    "book_reservation": {
+        "main": "📚 **BOOK RESERVATION**\n\nIf a book is currently checked out, you can place a hold on it.\n\n**Steps:**\n1. Search for the book in our catalog\n2. Click 'Place Hold'\n3. You will be notified via email when it's available.",
+        "follow_up": "Need help finding a specific book to reserve?"
+    },
+    "study_rooms": {
+        "main": "🏫 **STUDY ROOMS**\n\nWe have private and group study rooms available for booking.\n\n• **Duration:** Max 3 hours per session\n• **Capacity:** 2-8 people per room\n• **Booking:** Available via the library website or at the information desk.",
+        "follow_up": "Would you like the link to the booking system?"
+    },
+    "library_services": {
+        "main": "ℹ️ **LIBRARY SERVICES**\n\nBeyond books, we offer several services to support your studies:\n\n• 🖨️ **Printing & Scanning:** Available on the 1st floor\n• 💻 **Computer Lab:** Access to research databases\n• 🎓 **Workshops:** Citation management and research strategies\n• ☕ **Study Café:** Open during regular hours",
+        "follow_up": "Are you interested in any specific service?"
+    },
+    "fallback": {
+        "main": "I'm not sure I understand. Could you rephrase? For example, you could ask:\n• 'What are the library hours?'\n• 'How do I renew a book?'\n• 'Find books about biology'",
+        "follow_up": ""
+    }
+}
 
 
 class ResponseGenerator:
+    __slots__ = ('templates', '_main', '_followup', '_no_results', '_compiled', '_render_cached',
+                 '_fallback_template', '_fallback_main', '_intent_handlers')
+
     def __init__(self, templates_file: str = 'app/data/response_templates.json'):
-        print(f"📝 Loading response templates from: {templates_file}")
+        logger.debug("📝 Loading response templates from: %s", templates_file)
 
-        self.templates = self._get_default_templates()
-        if os.path.exists(templates_file):
+        # Shallow copy: loading only replaces whole intent entries, never mutates them
+        self.templates = dict(_DEFAULT_TEMPLATES)
+        try:
+            # One stat both checks existence and gives the cache key
+            mtime = os.stat(templates_file).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None:
             try:
-                content = self._read_file_with_encoding(templates_file)
-                if content:
-                    content = self._clean_unicode_content(content)
-                    file_templates = json.loads(content)
+                file_templates = self._load_cached_templates(templates_file, mtime)
+                if file_templates is None:
+                    file_templates = self._parse_templates_file(templates_file)
+                    if file_templates:
+                        self._save_cached_templates(templates_file, mtime, file_templates)
+                if file_templates:
                     self.templates.update(file_templates)
-                    print(f"✅ Loaded templates from: {templates_file}")
+                    logger.info("✅ Loaded templates from: %s", templates_file)
             except Exception as e:
-                print(f"⚠️ Failed to load {templates_file}: {e}")
-
-    def _clean_unicode_content(self, content: str) -> str:
-        """Clean Unicode content of common encoding issues"""
-        if not content:
-            return content
-        replacements = {
-            'â€¢': '•', 'â€"': '—', 'â€™': "'", 'â€˜': "'", 'â€œ': '"', 'â€': '"',
-            'Ã©': 'é', 'Ã¨': 'è', 'Ã¢': 'â', 'Ã': 'à', 'Ã±': 'ñ', 'Ã³': 'ó',
-            'Ãº': 'ú', 'Ã¶': 'ö', 'Ã¼': 'ü', 'ÃŸ': 'ß', 'Ã¦': 'æ', 'Ã¸': 'ø', 'Ã¥': 'å',
+                logger.warning("⚠️ Failed to load %s: %s", templates_file, e)
+
+        self._index_templates()
+        # Intents that build their reply from DB results; everything else fills its template
+        self._intent_handlers = {
+            'book_search': self._render_book_search,
+            'contact_info': self._render_contact_info,
         }
-        for bad, good in replacements.items():
-            content = content.replace(bad, good)
-        emoji_fixes = {'\ud83d\udcd6': '📚', '\ud83d\udc4b': '👋'}
-        for bad, good in emoji_fixes.items():
-            content = content.replace(bad, good)
-        return content
-
-    def _read_file_with_encoding(self, filepath: str) -> Optional[str]:
-        encodings = ['utf-8-sig', 'utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
-        for encoding in encodings:
+
+    def _index_templates(self):
+        """Flatten templates into per-field dicts so generation does a single lookup per field"""
+        # Interned keys let lookups with interned intents short-circuit on identity
+        self.templates = {sys.intern(k): v for k, v in self.templates.items()}
+        template_objs = {k: v for k, v in self.templates.items() if isinstance(v, dict)}
+        self._main = {k: v['main'] for k, v in template_objs.items() if 'main' in v}
+        self._followup = {k: v['follow_up'] for k, v in template_objs.items() if v.get('follow_up')}
+        self._no_results = {k: v['no_results'] for k, v in template_objs.items() if 'no_results' in v}
+        self._fallback_template = template_objs.get('fallback', {'main': "I can help you with that."})
+        self._fallback_main = self._fallback_template.get('main', "I can help you with that.")
+        self._compiled = {k: self._compile_template(v) for k, v in self._main.items() if isinstance(v, str)}
+        # Per instance so the cache is dropped along with the templates it was built from
+        self._render_cached = lru_cache(maxsize=512)(self._render_for_key)
+
+    @staticmethod
+    def _compile_template(template: str) -> tuple:
+        """Pre-split a template into (literal, placeholder-or-None) pairs"""
+        pieces = _TEMPLATE_VAR_RE.split(template)
+        tokens = [(pieces[i], pieces[i + 1]) for i in range(0, len(pieces) - 1, 2)]
+        tokens.append((pieces[-1], None))
+        return tuple(tokens)
+
+    @staticmethod
+    def _render_segments(tokens: tuple, data: Dict, tail: tuple = ()) -> tuple:
+        """
+        Fill a compiled template and append tail, leaving {current_time} out: the result is
+        split at each current_time slot so it can be cached and joined with the live time.
+        Unknown placeholders are left as {name}.
+        """
+        segments, parts = [], []
+        for literal, key in tokens:
+            parts.append(literal)
+            if key is None:
+                continue
+            if key == 'current_time':
+                segments.append(''.join(parts))
+                parts = []
+            else:
+                parts.append(str(data[key]) if key in data else '{' + key + '}')
+        parts.extend(tail)
+        segments.append(''.join(parts))
+        return tuple(segments)
+
+    def _render_for_key(self, key: str, entity_items: tuple) -> tuple:
+        """Render the main template and follow-up for key; cached by (key, entity_items)"""
+        follow_up = self._followup.get(key)
+        tail = ('\n\n', follow_up) if follow_up else ()
+        return self._render_segments(self._compiled[key], dict(entity_items), tail)
+
+    def _parse_templates_file(self, templates_file: str) -> Optional[Dict]:
+        """Parse the templates JSON straight from bytes, then clean mojibake in its string values"""
+        data = self._parse_mapped(templates_file) if orjson is not None else None
+        if data is None:
+            raw = Path(templates_file).read_bytes()
+            body = raw[3:] if raw.startswith(_UTF8_BOM) else raw
+            try:
+                data = _LOADS(body)
+            except (ValueError, UnicodeDecodeError):
+                # Not valid UTF-8 JSON - fall back to trying other encodings
+                content = self._read_file_with_encoding(templates_file, raw)
+                if not content:
+                    return None
+                data = json.loads(content)
+        return self._clean_template_values(data)
+
+    @staticmethod
+    def _parse_mapped(templates_file: str):
+        """Parse with orjson directly from an mmap of the file; None if empty or not UTF-8 JSON"""
+        with open(templates_file, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None  # an empty file can't be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                start = len(_UTF8_BOM) if view[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+                try:
+                    with view[start:] as body:
+                        return orjson.loads(body)
+                except orjson.JSONDecodeError:
+                    return None
+
+    def _clean_template_values(self, obj):
+        """Recursively clean string leaves only, leaving JSON structure and keys untouched"""
+        if isinstance(obj, str):
+            # Full response-level cleaning plus NFC, so text taken from templates is final at load
+            return unicodedata.normalize('NFC', self._clean_response(obj))
+        if isinstance(obj, dict):
+            return {k: self._clean_template_values(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._clean_template_values(v) for v in obj]
+        return obj
+
+    def _load_cached_templates(self, templates_file: str, mtime: int) -> Optional[Dict]:
+        """Return the parsed templates pickled next to the JSON file if it hasn't changed since"""
+        try:
+            with open(templates_file + '.cache', 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            # Missing, truncated or stale cache (unpickling can raise almost anything); reparse the JSON
+            return None
+        if (isinstance(cached, dict) and cached.get('mtime') == mtime
+                and cached.get('version') == _TEMPLATE_CACHE_VERSION):
+            return cached.get('templates')
+        return None
+
+    def _save_cached_templates(self, templates_file: str, mtime: int, templates: Dict):
+        """Write the parsed templates cache atomically so readers never see a partial file"""
+        cache_file = templates_file + '.cache'
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                cached = {'mtime': mtime, 'version': _TEMPLATE_CACHE_VERSION, 'templates': templates}
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning("⚠️ Could not write template cache %s: %s", cache_file, e)
             try:
-                with open(filepath, 'r', encoding=encoding) as f:
-                    return f.read()
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+    def _read_file_with_encoding(self, filepath: str, raw: bytes = None) -> Optional[str]:
+        if raw is None:
+            raw = Path(filepath).read_bytes()
+        for encoding in _FILE_ENCODINGS:
+            try:
+                return raw.decode(encoding)
             except UnicodeDecodeError:
                 continue
         return None
 
-    def _get_default_templates(self) -> Dict:
-        return {
-            "greeting": {
-                "main": "👋 **Hello! I'm the Babcock University Library Assistant.** \n\nI can help you with:\n• 📚 Finding books and resources\n• 🕐 Library hours and policies  \n• 🔍 Research and database access\n• 📝 Citations and references\n• 📞 Contact information\n\n**How can I assist you today?** Try asking:\n'What are the library hours?'\n'Find books about computer science'\n'How do I renew a book?'\n'Help with my research paper'",
-                "follow_up": ""
-            },
-            "book_search": {
-                "main": "📚 **BOOKS FOUND ({count})**\n\n{book_list}",
-                "no_results": "❌ That book isn't in our catalog. Would you like to:\n1. Try different search terms?\n2. Request an inter-library loan?\n3. Check eBook alternatives?",
-                "follow_up": "Need help locating any of these?"
-            },
-            "library_hours": {
-                "main": "🕐 **LIBRARY HOURS**\n\nWeekdays: **8:00 AM - 10:00 PM**\nWeekends: **10:00 AM - 8:00 PM**\n\n• Exam Period: 7:00 AM - 12:00 AM\n• Holidays: Closed\n\n_Current time: {current_time}_",
-                "follow_up": "Would you like to know about holiday schedules?"
-            },
-            "borrowing_policy": {
-                "main": "ℹ️ **BORROWING POLICY**\n\n**Students:**\n• Maximum books: **5**\n• Loan period: **14 days**\n• Renewals: **1 renewal** (if no holds)\n\n**Staff/Faculty:**\n• Maximum books: **10**\n• Loan period: **30 days**\n• Renewals: **2 renewals**\n\n**Overdue Fines:** ₦50 per day per book",
-                "follow_up": "Need to know how to renew your books?"
-            },
-            "contact_info": {
-                "main": "📞 **CONTACT INFORMATION**\n\n{contact_list}",
-                "follow_up": "Is there a specific department you're trying to reach?"
-            },
-            "research_assistance": {
-                "main": "🔍 **RESEARCH ASSISTANCE**\n\nI can help you find papers, databases, and guide you with citations.\n\n**Key Databases:**\n• JSTOR\n• IEEE Xplore\n• ScienceDirect\n\n**Tips:**\n• Use specific keywords\n• Check our citation guides for APA/MLA",
-                "follow_up": "What is your research topic?"
-            },
-            "book_renewal": {
-                "main": "📚 **BOOK RENEWAL**\n\nYou can renew books through your online account or at the circulation desk.\n\n**Policy:**\n• **1 renewal** for students\n• **2 renewals** for staff/faculty\n• Renewal is only possible if there are no active holds on the book.",
-                "follow_up": "Would you like me to check your borrowed books?"
-            },
-            "book_reservation": {
-                "main": "📚 **BOOK RESERVATION**\n\nIf a book is currently checked out, you can place a hold on it.\n\n**Steps:**\n1. Search for the book in our catalog\n2. Click 'Place Hold'\n3. You will be notified via email when it's available.",
-                "follow_up": "Need help finding a specific book to reserve?"
-            },
-            "study_rooms": {
-                "main": "🏫 **STUDY ROOMS**\n\nWe have private and group study rooms available for booking.\n\n• **Duration:** Max 3 hours per session\n• **Capacity:** 2-8 people per room\n• **Booking:** Available via the library website or at the information desk.",
-                "follow_up": "Would you like the link to the booking system?"
-            },
-            "library_services": {
-                "main": "ℹ️ **LIBRARY SERVICES**\n\nBeyond books, we offer several services to support your studies:\n\n• 🖨️ **Printing & Scanning:** Available on the 1st floor\n• 💻 **Computer Lab:** Access to research databases\n• 🎓 **Workshops:** Citation management and research strategies\n• ☕ **Study Café:** Open during regular hours",
-                "follow_up": "Are you interested in any specific service?"
-            },
-            "fallback": {
-                "main": "I'm not sure I understand. Could you rephrase? For example, you could ask:\n• 'What are the library hours?'\n• 'How do I renew a book?'\n• 'Find books about biology'",
-                "follow_up": ""
-            }
-        }
-
     def generate(self, response_data: Dict, context: Dict, method: str) -> str:
         try:
-            print(f"📝 Generating response with method: {method}")
+            logger.debug("Generating response with method: %s", method)
 
             # Add time-based greeting if it's the start
             prefix = ""
             if response_data.get('intent') == 'greeting':
-                hour = datetime.now().hour
+                hour = _now_state()[1]
                 if hour < 12: prefix = "Good morning! "
                 elif hour < 17: prefix = "Good afternoon! "
                 else: prefix = "Good evening! "
@@ -116,76 +346,105 @@ class ResponseGenerator:
             else:
                 response = self._generate_clarification(response_data, context)
 
-            response = prefix + self._clean_response(response)
-            return response
+            # Templates are cleaned once at load and the NLP path cleans the values it fills in,
+            # so only responses built from outside text need the full pass here
+            if method in _EXTERNAL_TEXT_METHODS:
+                response = self._clean_response(response)
+            return prefix + response
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Response generation failed (method=%s)", method)
             return "I'm here to help with library services. How can I assist you today?"
 
     def _generate_from_nlp(self, nlp_data: Dict, context: Dict) -> str:
-        intent = nlp_data.get('intent', 'fallback')
-        template_obj = self.templates.get(intent, self.templates.get('fallback', {}))
+        intent = sys.intern(str(nlp_data.get('intent', 'fallback')))
+        key = intent if intent in self.templates else 'fallback'
+        handler = self._intent_handlers.get(intent, self._render_default)
+        return handler(nlp_data, key)
 
-        # Check for database results first if relevant
+    def _render_book_search(self, nlp_data: Dict, key: str) -> str:
         db_results = nlp_data.get('db_results')
+        if db_results:
+            book_list = self._clean_response("\n".join([
+                f"• **{b['title']}** by {b['author']}\n  📍 Location: {b['location']}\n  📅 Available: {b['copies_available']} copies"
+                for b in db_results
+            ]))
+            main = self._main.get(key)
+            if main is None:
+                return f"📚 **BOOKS FOUND ({len(db_results)})**\n\n" + book_list
+            return self._safe_format(main, {'count': len(db_results), 'book_list': book_list})
 
-        if intent == 'book_search':
-            if db_results:
-                book_strings = []
-                for b in db_results:
-                    book_strings.append(f"• **{b['title']}** by {b['author']}\n  📍 Location: {b['location']}\n  📅 Available: {b['copies_available']} copies")
-                try:
-                    return template_obj['main'].format(count=len(db_results), book_list="\n".join(book_strings))
-                except KeyError:
-                    return f"📚 **BOOKS FOUND ({len(db_results)})**\n\n" + "\n".join(book_strings)
-            else:
-                query = nlp_data.get('text', 'your query')
-                try:
-                    return template_obj['no_results'].format(query=query)
-                except KeyError:
-                    return "❌ That book isn't in our catalog. Would you like to:\n1. Try different search terms?\n2. Request an inter-library loan?\n3. Check eBook alternatives?"
-
-        if intent == 'contact_info':
-            if db_results:
-                contact_strings = []
-                for c in db_results:
-                    contact_strings.append(f"• **{c['department']}**\n  📞 {c['phone']}\n  📧 {c['email']}\n  🕐 Hours: {c['hours']}")
-                return template_obj['main'].format(contact_list="\n".join(contact_strings))
-
-        template = template_obj.get('main', "I can help you with that.")
+        no_results = self._no_results.get(key)
+        if no_results is None:
+            return "❌ That book isn't in our catalog. Would you like to:\n1. Try different search terms?\n2. Request an inter-library loan?\n3. Check eBook alternatives?"
+        return self._safe_format(no_results, {'query': self._clean_value(nlp_data.get('text', 'your query'))})
+
+    def _render_contact_info(self, nlp_data: Dict, key: str) -> str:
+        db_results = nlp_data.get('db_results')
+        main = self._main.get(key)
+        if not db_results or main is None:
+            return self._render_default(nlp_data, key)
+        contact_list = self._clean_response("\n".join([
+            f"• **{c['department']}**\n  📞 {c['phone']}\n  📧 {c['email']}\n  🕐 Hours: {c['hours']}"
+            for c in db_results
+        ]))
+        return self._safe_format(main, {'contact_list': contact_list})
+
+    def _render_default(self, nlp_data: Dict, key: str) -> str:
+        """Fill the intent's main template from the entities and append its follow-up"""
         entities = nlp_data.get('entities', [])
-        entity_dict = {e['label']: e['text'] for e in entities if isinstance(e, dict) and 'label' in e}
-        entity_dict['current_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # The NLP engine mixes spaCy (label/text) and custom regex (type/value) entities in one list,
+        # so the shape is detected per entity
+        entity_dict = {}
+        for e in entities:
+            shape = _detect_shape(e)
+            if shape is not None:
+                entity_dict[e[shape[0]]] = self._clean_value(e[shape[1]])
+
+        if key in self._compiled:
+            try:
+                segments = self._render_cached(key, tuple(sorted(entity_dict.items())))
+            except TypeError:
+                # Unhashable or unorderable entity values - render without the cache
+                segments = self._render_for_key(key, tuple(entity_dict.items()))
+            if len(segments) == 1:
+                return segments[0]
+            return _cached_now().join(segments)
 
+        template = self._main.get(key, "I can help you with that.")
+        # The follow-up goes into the same join as the template text
+        follow_up = self._followup.get(key)
+        tail = ('\n\n', follow_up) if follow_up else ()
+        entity_dict['current_time'] = _cached_now()
         try:
             response = self._safe_format(template, entity_dict)
         except Exception:
             response = template
 
-        follow_up = template_obj.get('follow_up')
-        if follow_up:
-            response += f"\n\n{follow_up}"
-
-        return response
+        return ''.join((response, *tail))
 
     def _safe_format(self, template: str, data: Dict) -> str:
         def replace(match):
             key = match.group(1)
             return str(data.get(key, match.group(0)))
-        return re.sub(r'\{(\w+)\}', replace, template)
+        return _TEMPLATE_VAR_RE.sub(replace, template)
 
     def _clean_response(self, text: str) -> str:
         if not text: return ""
-        text = self._clean_unicode_content(text)
-        fixes = {'ð': '📚', 'â¢': '•', 'â€¢': '•'}
-        for bad, good in fixes.items():
-            text = text.replace(bad, good)
-        try:
-            return text.encode('utf-8', errors='ignore').decode('utf-8')
-        except:
-            return ''.join(char for char in text if ord(char) < 128)
+        # Mojibake needs non-ASCII characters, so plain ASCII can skip the scan
+        if text.isascii(): return text
+        text = _RESPONSE_FIX_RE.sub(_fix_response, text)
+        if _RESPONSE_FIX_TABLE:
+            text = text.translate(_RESPONSE_FIX_TABLE)
+        # A str is valid Unicode unless it holds surrogates; only then pay for a re-encode
+        if _SURROGATE_RE.search(text):
+            # Joins valid surrogate pairs into their real character and drops lone halves
+            text = text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'ignore')
+        return text
+
+    def _clean_value(self, value):
+        """Clean a value headed into a template; non-strings pass through untouched"""
+        return self._clean_response(value) if isinstance(value, str) else value
 
     def _generate_from_rule(self, rule_data: Dict, context: Dict) -> str:
         # Simplistic rule generation for now
@@ -195,4 +454,4 @@ class ResponseGenerator:
         return kb_data.get('answer', "I searched our knowledge base but couldn't find a specific answer.")
 
     def _generate_clarification(self, data: Dict, context: Dict) -> str:
-        return self.templates['fallback']['main']
+        return self._fallback_main
@@ -1,7 +1,119 @@
-import re, os
+import os
 import json
-from typing import Dict, List
+import mmap
+import pickle
+import sys
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import regex as re  # drop-in replacement, faster on the alternation-heavy rule patterns
+except ImportError:
+    import re
+
+# Leading inline flag every rule carries; rules are compiled with IGNORECASE anyway
+_INLINE_IGNORECASE = '(?i)'
+# Pattern characters the literal prefilter understands as plain text
+_LITERAL_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ')
+# Escapes that stand for exactly one character (or none); anything else defeats the prefilter
+_SINGLE_CHAR_ESCAPES = frozenset('dDsSwWbBAZtnrfv')
+# Template placeholders and whitespace runs for _fill_template
+_PLACEHOLDER_RE = re.compile(r'\{(.*?)\}')
+_WHITESPACE_RE = re.compile(r'\s+')
+# Bump when the shape of the pickled rules cache changes
+_RULES_CACHE_VERSION = 1
+# Once a match this confident is found, lower priority tiers are not scanned
+_EARLY_EXIT_CONFIDENCE = 0.95
+
+
+def _required_literals(source: str) -> Optional[tuple]:
+    """
+    For a rule pattern like (a|b\\s*c|d(e|f)) return one lowercase literal per top-level
+    alternative that any text it matches must contain (its longest literal run outside
+    nested groups). None if the pattern uses other syntax or an alternative has no literal.
+    """
+    if source.startswith(_INLINE_IGNORECASE):
+        source = source[len(_INLINE_IGNORECASE):]
+    # Unwrap a capturing group around the whole pattern
+    while source.startswith('(') and source.endswith(')') and not source.startswith('(?'):
+        depth = 0
+        for i, c in enumerate(source):
+            depth += c == '('
+            depth -= c == ')'
+            if depth == 0:
+                break
+        if i != len(source) - 1:
+            break
+        source = source[1:-1]
+
+    literals, best, run = [], '', ''
+    depth, i = 0, 0
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            # Only single-character escapes are understood; \xHH, \uHHHH, \N{...}, \p{...},
+            # backreferences and octal escapes carry more characters that aren't literal text
+            if source[i + 1:i + 2] not in _SINGLE_CHAR_ESCAPES:
+                return None
+            best, run = max(best, run, key=len), ''  # a class escape like \s breaks the literal
+            i += 2
+            continue
+        if c == '(':
+            if source[i + 1:i + 2] == '?':
+                return None
+            depth += 1
+            best, run = max(best, run, key=len), ''
+        elif c == ')':
+            depth -= 1
+            best, run = max(best, run, key=len), ''
+        elif c == '|' and depth == 0:
+            best = max(best, run, key=len)
+            if not best:
+                return None
+            literals.append(best)
+            best, run = '', ''
+        elif c == '|':
+            pass  # alternation inside a nested group; its contents are never part of a literal
+        elif c in '?*':
+            # The quantified character is optional, so it can't be part of the literal
+            best, run = max(best, run[:-1], key=len), ''
+        elif c == '+':
+            best, run = max(best, run, key=len), ''
+        elif c in _LITERAL_CHARS:
+            if depth == 0:
+                run += c.lower()
+        else:
+            return None
+        i += 1
+    best = max(best, run, key=len)
+    if not best:
+        return None
+    literals.append(best)
+    return tuple(literals)
+
+
+class CompiledRule:
+    """
+    A rule from the rules file with its pattern compiled and keywords pre-lowercased.
+    check is the rule's conditions compiled into a callable(context, now_hour) -> bool, or None if it has none.
+    """
+    __slots__ = ('pattern', 'response', 'priority', 'id', 'kw_lower', 'conditions', 'check')
+
+    def __init__(self, pattern, response: str, priority: int, rule_id: str,
+                 kw_lower: tuple = (), conditions: tuple = (), check: Callable = None):
+        self.pattern = pattern
+        self.response = response
+        self.priority = priority
+        self.id = rule_id
+        self.kw_lower = kw_lower
+        self.conditions = conditions
+        self.check = check
 
 
 class AdvancedRuleEngine:
@@ -10,8 +122,7 @@ class AdvancedRuleEngine:
 
         if os.path.exists(rules_file):
             try:
-                with open(rules_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = self._load_rules_data(rules_file)
 
                 # Check if data is a dict with 'rules' key
                 if isinstance(data, dict) and 'rules' in data:
@@ -32,6 +143,55 @@ class AdvancedRuleEngine:
 
         self.compiled_patterns = self._compile_patterns()
 
+    def _load_rules_data(self, rules_file: str):
+        """Parsed rules file, taken from the pickle cache beside it if the file hasn't changed"""
+        mtime = os.stat(rules_file).st_mtime_ns
+        data = self._load_cached_rules(rules_file, mtime)
+        if data is None:
+            data = self._parse_rules_file(rules_file)
+            self._save_cached_rules(rules_file, mtime, data)
+        return data
+
+    @staticmethod
+    def _parse_rules_file(rules_file: str):
+        """Parse the rules JSON, with orjson straight from an mmap of the file when available"""
+        with open(rules_file, 'rb') as f:
+            if orjson is None:
+                return json.load(f)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+
+    @staticmethod
+    def _load_cached_rules(rules_file: str, mtime: int) -> Optional[object]:
+        """Return the pickled parse of rules_file if it was taken at the same mtime"""
+        try:
+            with open(rules_file + '.cache', 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            # Missing, truncated or stale cache (unpickling can raise almost anything); reparse the JSON
+            return None
+        if (isinstance(cached, dict) and cached.get('mtime') == mtime
+                and cached.get('version') == _RULES_CACHE_VERSION):
+            return cached.get('data')
+        return None
+
+    @staticmethod
+    def _save_cached_rules(rules_file: str, mtime: int, data):
+        """Write the rules cache atomically so readers never see a partial file"""
+        cache_file = rules_file + '.cache'
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                cached = {'mtime': mtime, 'version': _RULES_CACHE_VERSION, 'data': data}
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"⚠️ Could not write rules cache {cache_file}: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
     # def _compile_patterns(self) -> List[Dict]:
     #     """Compile regex patterns for efficient matching"""
     #     compiled = []
@@ -56,30 +216,38 @@ class AdvancedRuleEngine:
         for rule in self.rules:
             # Check pattern match
             if 'pattern' in rule:
-                pattern = rule['pattern'].lower()
-                if self._pattern_matches(pattern, text_lower):
+                if self._pattern_matches(rule, text_lower):
                     matching_rules.append(rule)
                     continue
 
             # Check keyword match
-            if 'keywords' in rule and rule['keywords']:
-                keywords = [kw.lower() for kw in rule['keywords']]
-                if any(kw in text_lower for kw in keywords):
-                    matching_rules.append(rule)
+            if any(kw in text_lower for kw in rule.get('_kw_lower', ())):
+                matching_rules.append(rule)
 
         return matching_rules
 
-    def _pattern_matches(self, pattern: str, text: str) -> bool:
+    def _pattern_matches(self, rule: Dict, text: str) -> bool:
         """
-        Check if text matches a pattern (supports wildcards)
+        Check if text matches a rule's pattern (supports wildcards)
         """
-        # Convert wildcard pattern to regex
-        if '*' in pattern:
-            regex_pattern = pattern.replace('*', '.*')
-            import re
-            return bool(re.match(regex_pattern, text, re.IGNORECASE))
-        else:
-            return pattern in text
+        # Wildcard regex is compiled once in _compile_wildcards
+        wildcard_re = rule.get('_wc_re')
+        if wildcard_re is not None:
+            return wildcard_re.match(text) is not None
+        return rule['pattern'].lower() in text
+
+    def _compile_wildcards(self, rule: Dict):
+        """Precompile the '*' wildcard forms of a rule pattern used by the legacy matchers"""
+        pattern_str = rule['pattern']
+        if '*' not in pattern_str:
+            return
+        try:
+            rule['_wc_re'] = re.compile(pattern_str.lower().replace('*', '.*'), re.IGNORECASE)
+            entity_re = re.compile(pattern_str.replace('*', '(.*?)'), re.IGNORECASE)
+            rule['_wc_entity_re'] = entity_re
+            rule['_wc_entity_types'] = tuple(f'rule_entity_{i}' for i in range(entity_re.groups))
+        except re.error as e:
+            print(f"⚠️ Error compiling wildcard pattern: {e}")
 
     def _compile_patterns(self):
         """Compile regex patterns"""
@@ -107,15 +275,29 @@ class AdvancedRuleEngine:
             try:
                 # Check if rule is a dictionary
                 if isinstance(rule, dict):
+                    keywords = rule.get('keywords')
+                    # Interned so rules sharing a keyword share one string object
+                    rule['_kw_lower'] = tuple(
+                        sys.intern(kw.lower()) for kw in keywords if kw and isinstance(kw, str)
+                    ) if isinstance(keywords, list) else ()
                     pattern_str = rule.get('pattern', '')
                     if pattern_str:
+                        self._compile_wildcards(rule)
                         pattern = re.compile(pattern_str, re.IGNORECASE)
-                        compiled.append({
-                            'pattern': pattern,
-                            'response': rule.get('response', ''),
-                            'priority': rule.get('priority', 1),
-                            'id': rule.get('id', '')
-                        })
+                        pattern.search('')  # warm up lazily built matcher state before the first request
+                        conditions = rule.get('conditions')
+                        conditions = tuple(
+                            c for c in conditions if isinstance(c, dict)
+                        ) if isinstance(conditions, list) else ()
+                        compiled.append(CompiledRule(
+                            pattern,
+                            rule.get('response', ''),
+                            rule.get('priority', 1),
+                            rule.get('id', ''),
+                            kw_lower=rule['_kw_lower'],
+                            conditions=conditions,
+                            check=self._compile_conditions(conditions)
+                        ))
                 else:
                     print(f"⚠️ Rule is not a dict: {rule}")
             except Exception as e:
@@ -123,29 +305,97 @@ class AdvancedRuleEngine:
                 continue
 
         print(f"✅ Compiled {len(compiled)} patterns")
+        # Highest priority first; the sort is stable so file order is kept within a priority tier
+        compiled.sort(key=lambda rule: rule.priority, reverse=True)
+        self._index_rules(compiled)
         return compiled
 
-    def match(self, text: str, intent: str = None, context: Dict = None) -> Dict:
-        """Match text against rules with context awareness"""
-        matches = []
+    def _index_rules(self, compiled: List[CompiledRule]):
+        """Parallel per-rule lists so match() reads plain sequences instead of rule objects"""
+        self._rule_patterns = [rule.pattern for rule in compiled]
+        self._rule_ids = [rule.id for rule in compiled]
+        self._rule_responses = [rule.response for rule in compiled]
+        self._rule_priorities = [rule.priority for rule in compiled]
+        self._rule_keywords = [rule.kw_lower for rule in compiled]
+        self._has_keywords = any(self._rule_keywords)
+        self._rule_base_confidence = [self._base_rule_confidence(rule) for rule in compiled]
+        # Literals one of which must occur in the text for the rule to match; None = always try it
+        self._rule_literals = [_required_literals(rule.pattern.pattern) for rule in compiled]
+        # Results of time-based rules depend on the hour, so it becomes part of the cache key
+        self._time_sensitive = any(condition.get('type') == 'time_based'
+                                   for rule in compiled for condition in rule.conditions)
+        # Per instance so cached results are dropped along with the rules they came from
+        self._match_cached = lru_cache(maxsize=1024)(self._match_for_key)
 
-        for rule in self.compiled_patterns:
+    def match(self, text: str, intent: str = None, context: Dict = None) -> Dict:
+        """Match text against rules with context awareness; repeated queries come from a cache"""
+        try:
+            context_key = tuple(sorted(context.items())) if context else ()
+            hash(context_key)
+            cacheable = True
+        except TypeError:
+            # Unhashable context values (e.g. history lists) can't be cached
+            cacheable = False
+        # One clock read per request, shared by every time_based condition
+        now_hour = datetime.now().hour if self._time_sensitive else None
+        if not cacheable:
+            return self._match_uncached(text, context, now_hour)
+        result = self._match_cached(text, context_key, now_hour)
+        if result is not None:
+            # Callers get their own dicts so they can't alter the cached entry
+            result = dict(result, response_data=dict(result['response_data']))
+        return result
+
+    def _match_for_key(self, text: str, context_key: tuple, now_hour: Optional[int]) -> Optional[Dict]:
+        """Cache entry point, keyed on the hour as well when time_based rules exist"""
+        return self._match_uncached(text, dict(context_key), now_hour)
+
+    def _match_uncached(self, text: str, context: Optional[Dict], now_hour: Optional[int]) -> Optional[Dict]:
+        """Run every rule against text; now_hour is only read by time_based conditions"""
+        prefilter = text.isascii()
+        # Only the prefilter and keyword boost read the lowercased text
+        text_lower = text.lower() if prefilter or self._has_keywords else text
+        rule_literals = self._rule_literals
+        # Running argmax over matching rules (sorted by priority); strict '>' keeps the first rule on ties
+        priorities = self._rule_priorities
+        best_index = -1
+        best_confidence = 0.0
+        best_groups = ()
+        # Context entries count as entities for the confidence boost
+        entity_boost = self._entity_boost(context)
+        keyword_hits = {}
+
+        for i, rule in enumerate(self.compiled_patterns):
+            if best_confidence >= _EARLY_EXIT_CONFIDENCE and priorities[i] != priorities[best_index]:
+                break
+            # Cheap substring prefilter before running the regex; only exact for ASCII text,
+            # since IGNORECASE can match a few non-ASCII characters to ASCII letters
+            literals = rule_literals[i]
+            if prefilter and literals is not None:
+                for lit in literals:
+                    if lit in text_lower:
+                        break
+                else:
+                    continue
             # Check pattern match
-            if rule['pattern'].search(text):
-                # Check conditions if any
-                if self._check_conditions(rule.get('conditions', []), context):
-                    matches.append({
-                        'rule_id': rule.get('id'),
-                        'pattern': rule['pattern'].pattern,
-                        'response_template': rule['response'],
-                        'priority': rule['priority'],
-                        'match_groups': rule['pattern'].search(text).groups(),
-                        'confidence': self._calculate_rule_confidence(rule, text, context)
-                    })
-
-        if matches:
-            # Return highest priority match
-            best_match = max(matches, key=lambda x: x['confidence'])
+            m = self._rule_patterns[i].search(text)
+            # Check conditions if any
+            if m and (rule.check is None or rule.check(context, now_hour)):
+                confidence = self._calculate_rule_confidence(i, text_lower, entity_boost, keyword_hits)
+                if best_index < 0 or confidence > best_confidence:
+                    best_index, best_confidence = i, confidence
+                    best_groups = m.groups()
+
+        if best_index >= 0:
+            # Only the winning rule is materialised as a match dict
+            best_match = {
+                'rule_id': self._rule_ids[best_index],
+                'pattern': self._rule_patterns[best_index].pattern,
+                'response_template': self._rule_responses[best_index],
+                'priority': self._rule_priorities[best_index],
+                'match_groups': best_groups,
+                'confidence': best_confidence
+            }
             return {
                 'type': 'rule_based',
                 'confidence': best_match['confidence'],
@@ -156,14 +406,46 @@ class AdvancedRuleEngine:
 
         return None
 
-    def _check_conditions(self, conditions: List, context: Dict) -> bool:
-        """Check if all conditions are met"""
+    @staticmethod
+    def _compile_conditions(conditions: tuple) -> Optional[Callable[[Dict, int], bool]]:
+        """
+        Bake a rule's conditions into one callable(context, now_hour) with the same semantics
+        as _check_conditions; None when there is nothing to check
+        """
+        checks = []
+        for condition in conditions:
+            condition_type = condition.get('type')
+
+            if condition_type == 'time_based':
+                start = condition.get('start_hour', 0)
+                end = condition.get('end_hour', 24)
+                checks.append(lambda context, now_hour, start=start, end=end: start <= now_hour < end)
+
+            elif condition_type == 'user_type':
+                required_type = condition.get('required_type')
+                checks.append(lambda context, now_hour, required_type=required_type:
+                              not context or context.get('user_type') == required_type)
+
+            elif condition_type == 'prerequisite':
+                required_intent = condition.get('required_intent')
+                checks.append(lambda context, now_hour, required_intent=required_intent:
+                              not context or required_intent in context.get('history_intents', []))
+
+        if not checks:
+            return None
+        checks = tuple(checks)
+        return lambda context, now_hour: all(check(context, now_hour) for check in checks)
+
+    def _check_conditions(self, conditions: List, context: Dict, now_hour: int = None) -> bool:
+        """Check if all conditions are met; now_hour defaults to the current hour"""
         for condition in conditions:
             condition_type = condition.get('type')
 
             if condition_type == 'time_based':
                 # Check if current time is within specified range
-                current_hour = datetime.now().hour
+                if now_hour is None:
+                    now_hour = datetime.now().hour
+                current_hour = now_hour
                 start = condition.get('start_hour', 0)
                 end = condition.get('end_hour', 24)
                 if not (start <= current_hour < end):
@@ -213,15 +495,16 @@ class AdvancedRuleEngine:
     #     # Ensure confidence is between 0 and 1
     #     return min(max(base_confidence, 0.0), 1.0)
 
-    def _calculate_rule_confidence(self, matched_rule: Dict, text: str, entities: List[Dict] = None) -> float:
+    @staticmethod
+    def _base_rule_confidence(rule: CompiledRule) -> float:
         """
-        Calculate confidence score for a matched rule
+        The part of a rule's confidence that doesn't depend on the request, computed at load
         """
         base_confidence = 0.7  # Default base confidence
 
         # Boost confidence based on pattern match quality
-        if 'pattern' in matched_rule and matched_rule['pattern']:
-            pattern = matched_rule['pattern']
+        pattern = rule.pattern
+        if pattern:
             # More specific patterns get higher confidence
             if isinstance(pattern, str):
                 if len(pattern.split()) >= 3:
@@ -229,47 +512,60 @@ class AdvancedRuleEngine:
                 if '*' not in pattern:  # No wildcards = more specific
                     base_confidence += 0.1
 
-        # Boost confidence if we have matching entities
-        if entities:
-            entity_boost = min(len(entities) * 0.05, 0.2)
-            base_confidence += entity_boost
+        return base_confidence
+
+    @staticmethod
+    def _entity_boost(entities) -> float:
+        """Confidence boost for the entities of a request; the same for every rule it matches"""
+        return min(len(entities) * 0.05, 0.2) if entities else 0.0
+
+    def _calculate_rule_confidence(self, index: int, text_lower: str, entity_boost: float,
+                                   keyword_hits: Dict[str, bool] = None) -> float:
+        """
+        Calculate confidence score for matched rule index (text_lower is the already-lowercased input).
+        keyword_hits memoises keyword-in-text checks across the rules of one request.
+        """
+        base_confidence = self._rule_base_confidence[index] + entity_boost
 
         # Boost for exact keyword matches
-        if 'keywords' in matched_rule and matched_rule['keywords']:
-            keywords = matched_rule['keywords']
-            if isinstance(keywords, list) and keywords:
-                matched_keywords = sum(
-                    1 for kw in keywords if kw and isinstance(kw, str) and kw.lower() in text.lower())
-                if matched_keywords > 0:
-                    keyword_boost = min(matched_keywords * 0.05, 0.15)
-                    base_confidence += keyword_boost
+        keywords = self._rule_keywords[index]
+        if keywords:
+            if keyword_hits is None:
+                keyword_hits = {}
+            matched_keywords = 0
+            for kw in keywords:
+                hit = keyword_hits.get(kw)
+                if hit is None:
+                    hit = keyword_hits[kw] = kw in text_lower
+                matched_keywords += hit
+            if matched_keywords > 0:
+                keyword_boost = min(matched_keywords * 0.05, 0.15)
+                base_confidence += keyword_boost
 
         # Ensure confidence is between 0 and 1
         return min(max(base_confidence, 0.0), 1.0)
 
-    def _extract_rule_entities(self, text: str, rule_pattern: str) -> List[Dict]:
+    def _extract_rule_entities(self, text: str, rule: Dict) -> List[Dict]:
         """
         Extract entities based on rule pattern
         """
         entities = []
 
         # Check for wildcard patterns like *book*
-        if '*' in rule_pattern:
+        entity_re = rule.get('_wc_entity_re')
+        if entity_re is not None:
             # Extract text between wildcards
-            import re
-            pattern = rule_pattern.replace('*', '(.*?)')
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-
-            for match in matches:
-                if match.groups():
-                    for i, group in enumerate(match.groups()):
-                        if group:  # Only add non-empty matches
-                            entities.append({
-                                'type': f'rule_entity_{i}',
-                                'value': group,
-                                'start': match.start(i + 1),
-                                'end': match.end(i + 1)
-                            })
+            entity_types = rule['_wc_entity_types']
+            for match in entity_re.finditer(text):
+                for i, group in enumerate(match.groups()):
+                    if group:  # Only add non-empty matches
+                        start, end = match.span(i + 1)
+                        entities.append({
+                            'type': entity_types[i],
+                            'value': group,
+                            'start': start,
+                            'end': end
+                        })
 
         return entities
 
@@ -291,45 +587,20 @@ class AdvancedRuleEngine:
         if context is None:
             context = {}
 
-        # Start with the template
-        result = template
-
-        # Replace context variables
-        for key, value in context.items():
-            if isinstance(value, (str, int, float)):
-                placeholder = f"{{{key}}}"
-                if placeholder in result:
-                    result = result.replace(placeholder, str(value))
-
-        # Replace entity references
+        # Everything a placeholder can resolve to; context values take precedence
+        values = {key: str(value) for key, value in context.items() if isinstance(value, (str, int, float))}
         if entities:
-            # Look for {entity_type} patterns
-            import re
-            entity_placeholders = re.findall(r'\{entity_(\w+)\}', result)
-
-            for placeholder in entity_placeholders:
-                # Find the first entity of this type
-                for entity in entities:
-                    if entity.get('type') == placeholder or entity.get('label') == placeholder:
-                        result = result.replace(f'{{entity_{placeholder}}}',
-                                                str(entity.get('value', entity.get('text', ''))))
-                        break
-
-        # Replace {user} placeholder with generic user reference
-        if '{user}' in result and 'user_name' in context:
-            result = result.replace('{user}', context['user_name'])
-        elif '{user}' in result:
-            result = result.replace('{user}', 'there')
-
-        # Replace {library} placeholder
-        if '{library}' in result:
-            result = result.replace('{library}', 'the library')
-
-        # Replace any remaining placeholders with empty string
-        import re
-        result = re.sub(r'\{.*?\}', '', result)
+            # {entity_<type>} resolves to the first entity with that type or label
+            for entity in entities:
+                value = str(entity.get('value', entity.get('text', '')))
+                for name in (entity.get('type'), entity.get('label')):
+                    if isinstance(name, str):
+                        values.setdefault(f'entity_{name}', value)
+        values.setdefault('user', str(context['user_name']) if 'user_name' in context else 'there')
+        values.setdefault('library', 'the library')
+
+        # One pass over the template; any unknown placeholder becomes an empty string
+        result = _PLACEHOLDER_RE.sub(lambda m: values.get(m.group(1), ''), template)
 
         # Clean up extra spaces
-        result = ' '.join(result.split())
-
-        return result
\ No newline at end of file
+        return _WHITESPACE_RE.sub(' ', result).strip()
\ No newline at end of file
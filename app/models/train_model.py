@@ -5,9 +5,9 @@ Train NLP models for the library chatbot
 
 import os
 import joblib
-import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.naive_bayes import ComplementNB
+from sklearn.pipeline import Pipeline
 import numpy as np
 
 print("🚀 Training NLP models for library chatbot...")
@@ -63,39 +63,45 @@ training_data = {
 }
 
 # 1. Train TF-IDF Vectorizer
+# Hashed features keep no vocabulary dict; the pipeline still exposes transform() for nlp_engine
 print("📊 Training TF-IDF vectorizer...")
-vectorizer = TfidfVectorizer(
-    max_features=1000,
-    stop_words='english',
-    ngram_range=(1, 2)
-)
+vectorizer = Pipeline([
+    ('hash', HashingVectorizer(
+        n_features=2 ** 14,
+        alternate_sign=False,
+        stop_words='english',
+        ngram_range=(1, 2),
+        dtype=np.float32  # half the memory of the default float64, same sparse CSR output
+    )),
+    ('tfidf', TfidfTransformer())
+])
 X = vectorizer.fit_transform(training_data['texts'])
 
 # Save vectorizer
 vectorizer_path = 'tfidf_vectorizer.pkl'
-joblib.dump(vectorizer, vectorizer_path)
+joblib.dump(vectorizer, vectorizer_path, compress=('zlib', 3))
 print(f"✅ Saved vectorizer to {vectorizer_path}")
 
 # 2. Train Intent Classifier
 print("🧠 Training intent classifier...")
 y = np.array(training_data['intents'])
-classifier = MultinomialNB()
+classifier = ComplementNB()  # better suited than MultinomialNB to short, imbalanced intent texts
 classifier.fit(X, y)
+# float32 halves the largest array, which NLPEngine maps from disk
+classifier.feature_log_prob_ = classifier.feature_log_prob_.astype(np.float32)
 
-# Save classifier
+# Save classifier uncompressed so it can be loaded with mmap_mode='r'
 classifier_path = 'intent_classifier.pkl'
-joblib.dump(classifier, classifier_path)
+joblib.dump(classifier, classifier_path, compress=0, protocol=5)
 print(f"✅ Saved classifier to {classifier_path}")
 
 # 3. Save training metadata
 metadata = {
     'classes': classifier.classes_.tolist(),
-    'feature_names': vectorizer.get_feature_names_out().tolist(),
     'training_samples': len(training_data['texts'])
 }
 metadata_path = 'training_metadata.pkl'
-with open(metadata_path, 'wb') as f:
-    pickle.dump(metadata, f)
+joblib.dump(metadata, metadata_path, compress=('zlib', 3))
 print(f"✅ Saved metadata to {metadata_path}")
 
 # Test the models
@@ -105,11 +111,12 @@ test_queries = [
     'can i borrow books'
 ]
 
-for query in test_queries:
-    X_test = vectorizer.transform([query])
-    proba = classifier.predict_proba(X_test)[0]
-    pred = classifier.predict(X_test)[0]
-    confidence = max(proba)
+# One batched transform/predict_proba; predictions are the argmax of the same probabilities
+X_test = vectorizer.transform(test_queries)
+probas = classifier.predict_proba(X_test)
+preds = classifier.classes_[probas.argmax(axis=1)]
+confidences = probas.max(axis=1)
+for query, pred, confidence in zip(test_queries, preds, confidences):
     print(f"Query: '{query}' → Intent: {pred} (confidence: {confidence:.2f})")
 
 print("\n🎉 Model training complete!")
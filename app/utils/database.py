@@ -1,14 +1,18 @@
+import logging
+
 from app.extensions import db
-from app.model import Feedback, User, Book, Contact
-from sqlalchemy import text, or_
+from app.model import Feedback, User, Book, Contact, ActivityLog, book_search_vector
+from sqlalchemy import text, or_, func, literal_column, select, lambda_stmt
+
+logger = logging.getLogger(__name__)
 
 def check_db_connection():
     """Check if the database connection is active"""
     try:
         db.session.execute(text('SELECT 1'))
         return True
-    except Exception as e:
-        print(f"Database connection error: {e}")
+    except Exception:
+        logger.exception("Database connection error")
         return False
 
 def store_feedback(message_id, rating, comment='', corrected_response='', user_id=None):
@@ -24,62 +28,65 @@ def store_feedback(message_id, rating, comment='', corrected_response='', user_i
         db.session.add(feedback)
         db.session.commit()
         return feedback.id
-    except Exception as e:
-        print(f"Error storing feedback: {e}")
+    except Exception:
+        logger.exception("Error storing feedback")
         db.session.rollback()
         return None
 
 def search_catalog(query='', author='', subject='', limit=20):
     """
     Search the local book catalog.
+
+    On Postgres, query is matched against title, author and topic by full-text search, i.e. by
+    whole stemmed words ("har" does not find "Harry"), plus a substring match on ISBN. Other
+    databases match query as a substring of any of those columns.
     """
     try:
-        q = Book.query
+        # Each lambda's SQL is compiled once and cached; the closure values are sent as bound parameters.
+        # Only the columns returned below are selected, as plain rows without building Book instances
+        stmt = lambda_stmt(lambda: select(Book.title, Book.author, Book.isbn, Book.copies_available,
+                                          Book.location, Book.summary, Book.id))
         if query:
-            q = q.filter(or_(
-                Book.title.ilike(f'%{query}%'),
-                Book.author.ilike(f'%{query}%'),
-                Book.topic.ilike(f'%{query}%'),
-                Book.isbn.ilike(f'%{query}%')
-            ))
+            pattern = f'%{query}%'
+            if db.engine.dialect.name == 'postgresql':
+                # Served by the books_fts and books_isbn_trgm GIN indexes
+                stmt += lambda s: s.where(or_(
+                    book_search_vector(Book.title, Book.author, Book.topic).op('@@')(
+                        func.plainto_tsquery(literal_column("'english'"), query)),
+                    Book.isbn.ilike(pattern)
+                ))
+            else:
+                stmt += lambda s: s.where(or_(
+                    Book.title.ilike(pattern),
+                    Book.author.ilike(pattern),
+                    Book.topic.ilike(pattern),
+                    Book.isbn.ilike(pattern)
+                ))
         if author:
-            q = q.filter(Book.author.ilike(f'%{author}%'))
+            author_pattern = f'%{author}%'
+            stmt += lambda s: s.where(Book.author.ilike(author_pattern))
         if subject:
-            q = q.filter(Book.topic.ilike(f'%{subject}%'))
+            subject_pattern = f'%{subject}%'
+            stmt += lambda s: s.where(Book.topic.ilike(subject_pattern))
+        stmt += lambda s: s.limit(limit)
 
-        results = q.limit(limit).all()
-        return [
-            {
-                'title': b.title,
-                'author': b.author,
-                'isbn': b.isbn,
-                'copies_available': b.copies_available,
-                'location': b.location,
-                'summary': b.summary,
-                'id': b.id
-            } for b in results
-        ]
-    except Exception as e:
-        print(f"Error searching catalog: {e}")
+        rows = db.session.execute(stmt).mappings()
+        return [dict(row) for row in rows]
+    except Exception:
+        logger.exception("Error searching catalog")
         return []
 
 def get_contact_info(department=None):
     """Get library contact information"""
     try:
-        q = Contact.query
+        stmt = lambda_stmt(lambda: select(Contact.department, Contact.phone, Contact.email, Contact.hours))
         if department:
-            q = q.filter(Contact.department.ilike(f'%{department}%'))
-        results = q.all()
-        return [
-            {
-                'department': c.department,
-                'phone': c.phone,
-                'email': c.email,
-                'hours': c.hours
-            } for c in results
-        ]
-    except Exception as e:
-        print(f"Error getting contact info: {e}")
+            pattern = f'%{department}%'
+            stmt += lambda s: s.where(Contact.department.ilike(pattern))
+        rows = db.session.execute(stmt).mappings()
+        return [dict(row) for row in rows]
+    except Exception:
+        logger.exception("Error getting contact info")
         return []
 
 def get_user_account(user_id):
@@ -93,11 +100,14 @@ def get_user_account(user_id):
                 'user_type': user.user_type
             }
         return None
-    except Exception as e:
-        print(f"Error getting user account: {e}")
+    except Exception:
+        logger.exception("Error getting user account")
         return None
 
 def get_user_activity(user_id, limit=50):
     """Get recent activity for a specific user"""
-    from app.model import ActivityLog
-    return ActivityLog.query.filter_by(user_id=user_id).order_by(ActivityLog.timestamp.desc()).limit(limit).all()
+    # Just the fields activities_schema shows, as rows rather than ActivityLog instances
+    return ActivityLog.query.with_entities(
+        ActivityLog.id, ActivityLog.activity_type, ActivityLog.activity_details,
+        ActivityLog.timestamp, ActivityLog.ip_address
+    ).filter_by(user_id=user_id).order_by(ActivityLog.timestamp.desc()).limit(limit).all()
@@ -1,22 +1,42 @@
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# One formatter shared by the console and file handlers
+_FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# The format above never shows thread or process details, so don't collect them for every record
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 
 def setup_logger(app):
     """Set up application logging"""
     log_level = app.config.get('LOG_LEVEL', 'INFO')
 
     # Configure logging
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(_FORMATTER)
     logging.basicConfig(
         level=getattr(logging, log_level),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        handlers=[console_handler]
     )
 
     # Add file handler if LOG_FILE is configured
     log_file = app.config.get('LOG_FILE')
     if log_file:
         os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-        app.logger.addHandler(file_handler)
+        # Rotate instead of growing without bound (50 MB x 5 backups)
+        file_handler = RotatingFileHandler(log_file, maxBytes=50_000_000, backupCount=5)
+        file_handler.setFormatter(_FORMATTER)
+
+        # Request threads only enqueue records; the listener thread does the file I/O
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        app.logger.addHandler(QueueHandler(log_queue))
 
     app.logger.info("Logger initialized")
@@ -4,45 +4,185 @@ Metrics and evaluation system for Intelligent Library Chat Assistant
 
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
+from bisect import bisect_left, bisect_right
+from itertools import islice
+import copy
 import json
+import re
 import statistics
-from collections import defaultdict
+from collections import defaultdict, deque
+import numpy as np
 import redis
 import os
+import threading
+import time
+
+try:
+    import orjson
+    _DUMPS = orjson.dumps
+except ImportError:
+    orjson = None
+    _DUMPS = json.dumps
+
+try:
+    import ahocorasick  # pyahocorasick: one automaton scan finds every task indicator
+except ImportError:
+    ahocorasick = None
+
+# Comment sentiment words for EvaluationSystem._calculate_satisfaction; matched as substrings
+_POSITIVE_WORDS = ('good', 'great', 'excellent', 'helpful', 'thanks', 'thank you', 'useful')
+_NEGATIVE_WORDS = ('bad', 'poor', 'terrible', 'unhelpful', 'useless', 'waste')
+_POSITIVE_RE = re.compile('|'.join(map(re.escape, _POSITIVE_WORDS)))
+_NEGATIVE_RE = re.compile('|'.join(map(re.escape, _NEGATIVE_WORDS)))
+
+# Phrases in a response that indicate the user's task was completed, per task type
+_TASK_INDICATORS = {
+    'book_search': ('found', 'available', 'located', 'search results'),
+    'information_query': ('answer is', 'information', 'details', 'explanation'),
+    'procedural_help': ('steps', 'process', 'procedure', 'how to'),
+    'policy_clarification': ('policy states', 'according to', 'rules', 'guidelines')
+}
+
+
+def _build_task_automaton():
+    """Aho-Corasick automaton mapping every indicator to its task type; None without pyahocorasick"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for task_type, indicators in _TASK_INDICATORS.items():
+        for indicator in indicators:
+            automaton.add_word(indicator, task_type)
+    automaton.make_automaton()
+    return automaton
+
+
+# EvaluationSystem keeps only this many recent evaluations and metric samples
+_MAX_EVALUATIONS = 1000
+
+# Distinct queries kept in the common_queries sorted set; the least frequent are trimmed past this
+_MAX_COMMON_QUERIES = 1000
+# Queries are counted by their first this-many characters once normalised
+_MAX_QUERY_LENGTH = 200
+# Seconds common_queries lives after the last recorded interaction, matching interaction records
+_COMMON_QUERIES_TTL = 604800
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _normalize_query(message: str) -> str:
+    """Canonical form a message is counted under: lowercased, whitespace collapsed, trailing punctuation dropped"""
+    query = _WHITESPACE_RE.sub(' ', message).strip().lower().rstrip('?!. ')
+    return query[:_MAX_QUERY_LENGTH]
+
+# Shared by every MetricsTracker in the process; built on first use so .env has been loaded
+_POOL = None
+
+
+def _get_pool() -> redis.ConnectionPool:
+    """Return the process-wide Redis connection pool"""
+    global _POOL
+    if _POOL is None:
+        _POOL = redis.ConnectionPool(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            password=os.getenv('REDIS_PASSWORD', None),
+            decode_responses=True,
+            max_connections=int(os.getenv('REDIS_POOL_SIZE', 32))
+        )
+    return _POOL
+
 
 class MetricsTracker:
     """Tracks real-time metrics for the chatbot"""
 
+    # Counters read together by get_all_metrics with a single MGET
+    COUNTER_KEYS = (
+        'total_conversations',
+        'total_messages',
+        'successful_responses',
+        'failed_responses',
+        'sum_response_time'
+    )
+
     def __init__(self):
         try:
-            self.redis_client = redis.Redis(
-                host=os.getenv('REDIS_HOST', 'localhost'),
-                port=int(os.getenv('REDIS_PORT', 6379)),
-                password=os.getenv('REDIS_PASSWORD', None),
-                decode_responses=True
-            )
+            self.redis_client = redis.Redis(connection_pool=_get_pool())
             self.redis_client.ping()
         except Exception:
             print("⚠️ Redis not available for metrics, using in-memory storage")
+            class MockPipeline:
+                # Queues commands and runs them against the mock on execute(), like redis-py
+                def __init__(self, client): self.client, self.calls = client, []
+                def __getattr__(self, name):
+                    def queue(*args, **kwargs):
+                        self.calls.append((getattr(self.client, name), args, kwargs))
+                        return self
+                    return queue
+                def execute(self):
+                    calls, self.calls = self.calls, []
+                    return [fn(*args, **kwargs) for fn, args, kwargs in calls]
             class MockRedis:
                 def __init__(self): self.data = {}
                 def get(self, key): return self.data.get(key)
-                def set(self, key, val): self.data[key] = val
+                def mget(self, keys): return [self.data.get(key) for key in keys]
+                def set(self, key, val, ex=None): self.data[key] = val
                 def exists(self, key): return key in self.data
+                def setnx(self, key, val):
+                    if key in self.data: return False
+                    self.data[key] = val
+                    return True
                 def incr(self, key):
                     val = int(self.data.get(key, 0)) + 1
                     self.data[key] = val
                     return val
+                def incrbyfloat(self, key, amount):
+                    val = float(self.data.get(key, 0)) + amount
+                    self.data[key] = val
+                    return val
                 def hset(self, key, mapping=None, **kwargs):
                     if key not in self.data: self.data[key] = {}
                     if mapping: self.data[key].update(mapping)
                     self.data[key].update(kwargs)
                 def expire(self, key, time): pass
+                def delete(self, *keys):
+                    return sum(self.data.pop(key, None) is not None for key in keys)
+                def hincrby(self, key, field, amount=1):
+                    counts = self.data.setdefault(key, {})
+                    counts[field] = int(counts.get(field, 0)) + amount
+                    return counts[field]
+                def hgetall(self, key): return dict(self.data.get(key, {}))
+                def zincrby(self, key, amount, member):
+                    scores = self.data.setdefault(key, {})
+                    scores[member] = scores.get(member, 0) + amount
+                    return scores[member]
+                def zrevrange(self, key, start, end, withscores=False):
+                    rows = sorted(self.data.get(key, {}).items(), key=lambda row: (-row[1], row[0]))
+                    rows = rows[start:(end if end >= 0 else len(rows) + end) + 1]
+                    return rows if withscores else [member for member, _ in rows]
+                def zremrangebyrank(self, key, start, end):
+                    scores = self.data.get(key, {})
+                    ranked = sorted(scores, key=lambda member: (scores[member], member))
+                    doomed = ranked[start:(end if end >= 0 else len(ranked) + end) + 1]
+                    for member in doomed: del scores[member]
+                    return len(doomed)
+                def pfadd(self, key, *values):
+                    members = self.data.setdefault(key, set())
+                    before = len(members)
+                    members.update(values)
+                    return int(len(members) > before)
+                def pfcount(self, key): return len(self.data.get(key, ()))
+                def pipeline(self, transaction=True): return MockPipeline(self)
             self.redis_client = MockRedis()
 
         # Initialize counters
         self._init_counters()
 
+        # Last get_all_metrics result, reused for METRICS_CACHE_TTL seconds so dashboards polling
+        # at high frequency cost one set of Redis reads per window
+        self._metrics_ttl = float(os.getenv('METRICS_CACHE_TTL', 2))
+        self._metrics_cache = None
+        self._metrics_cached_at = 0.0
+        self._metrics_lock = threading.Lock()
+
     def _init_counters(self):
         """Initialize Redis counters"""
         counters = [
@@ -51,23 +191,34 @@ class MetricsTracker:
             'total_users',
             'successful_responses',
             'failed_responses',
-            'average_response_time'
+            'sum_response_time'
         ]
 
+        # Older deployments stored only average_response_time; seed the running sum from it so the
+        # average derived from sum_response_time / total_messages carries on from the same value
+        total_time, old_average, messages = self.redis_client.mget(
+            ('sum_response_time', 'average_response_time', 'total_messages'))
+
+        # SETNX leaves existing counters alone; MSETNX would skip all of them if any one exists
+        pipe = self.redis_client.pipeline(transaction=False)
+        if total_time is None:
+            pipe.setnx('sum_response_time', float(old_average or 0) * int(messages or 0))
         for counter in counters:
-            if not self.redis_client.exists(counter):
-                self.redis_client.set(counter, 0)
+            pipe.setnx(counter, 0)
+        if old_average is not None:
+            pipe.delete('average_response_time')
+        pipe.execute()
 
     def record_interaction(self, user_id: str, session_id: str, message: str,
                           response: str, response_time: float,
-                          confidence: float, method: str):
+                          confidence: float, method: str, intent: str = 'unknown'):
         """Record a single interaction"""
 
-        # Increment counters
-        self.redis_client.incr('total_messages')
+        # One clock read serves both the key suffix and the stored timestamp
+        now_ts = time.time()
 
         # Store interaction details
-        interaction_key = f"interaction:{user_id}:{session_id}:{int(datetime.now().timestamp())}"
+        interaction_key = f"interaction:{user_id}:{session_id}:{int(now_ts)}"
         interaction_data = {
             'user_id': user_id,
             'session_id': session_id,
@@ -76,23 +227,29 @@ class MetricsTracker:
             'response_time': response_time,
             'confidence': confidence,
             'method': method,
-            'timestamp': datetime.now().isoformat()
+            'intent': intent,
+            'timestamp': datetime.fromtimestamp(now_ts).isoformat()
         }
 
-        self.redis_client.hset(interaction_key, mapping=interaction_data)
-        self.redis_client.expire(interaction_key, 604800)  # Keep for 7 days
-
-        # Update response time average
-        current_avg = float(self.redis_client.get('average_response_time') or 0)
-        total_messages = int(self.redis_client.get('total_messages') or 1)
-        new_avg = ((current_avg * (total_messages - 1)) + response_time) / total_messages
-        self.redis_client.set('average_response_time', new_avg)
-
+        # Every write is an independent atomic command, so they all go out in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.incr('total_messages')
+        # The interaction is only ever read whole, so it is stored as one JSON string with its TTL
+        pipe.set(interaction_key, _DUMPS(interaction_data), ex=604800)  # Keep for 7 days
+        # Running total; the average is derived from it and total_messages when read
+        pipe.incrbyfloat('sum_response_time', response_time)
         # Track success
-        if confidence > 0.7:
-            self.redis_client.incr('successful_responses')
-        else:
-            self.redis_client.incr('failed_responses')
+        pipe.incr('successful_responses' if confidence > 0.7 else 'failed_responses')
+        # Aggregates for the dashboard, maintained by Redis instead of scanned at read time
+        pipe.hincrby('intent_counts', intent, 1)
+        query = _normalize_query(message)
+        if query:
+            pipe.zincrby('common_queries', 1, query)
+            pipe.zremrangebyrank('common_queries', 0, -_MAX_COMMON_QUERIES - 1)
+            # Holds user text, so it expires like the interaction records once traffic stops
+            pipe.expire('common_queries', _COMMON_QUERIES_TTL)
+        pipe.pfadd('unique_users', user_id)
+        pipe.execute()
 
     def record_session_start(self, user_id: str, session_id: str):
         """Record a new conversation session"""
@@ -115,76 +272,112 @@ class MetricsTracker:
             self.redis_client.hset(session_key, 'end_time', datetime.now().isoformat())
             if feedback_score:
                 self.redis_client.hset(session_key, 'feedback_score', feedback_score)
+                self.redis_client.hincrby('feedback_scores', feedback_score, 1)
+                # Satisfaction changed; don't serve it stale
+                self._metrics_cache = None
 
     def get_all_metrics(self) -> Dict:
-        """Get comprehensive system metrics"""
+        """Get comprehensive system metrics, cached for METRICS_CACHE_TTL seconds"""
+        with self._metrics_lock:
+            now = time.monotonic()
+            if self._metrics_cache is None or now - self._metrics_cached_at >= self._metrics_ttl:
+                self._metrics_cache = self._collect_metrics()
+                self._metrics_cached_at = now
+            cached = self._metrics_cache
+        # Callers get their own copy so mutating one result can't corrupt the shared cache
+        return copy.deepcopy(cached)
+
+    def _collect_metrics(self) -> Dict:
+        """Read every metric from Redis"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.mget(self.COUNTER_KEYS)
+        pipe.hgetall('intent_counts')
+        pipe.zrevrange('common_queries', 0, 9, withscores=True)
+        pipe.hgetall('feedback_scores')
+        pipe.pfcount('unique_users')
+        counters, intent_counts, top_queries, feedback_scores, unique_users = pipe.execute()
+
+        conversations, messages, successful, failed, total_time = counters
+        total_messages = int(messages or 0)
+        successful_responses = int(successful or 0)
         return {
-            'total_conversations': int(self.redis_client.get('total_conversations') or 0),
-            'total_messages': int(self.redis_client.get('total_messages') or 0),
-            'successful_responses': int(self.redis_client.get('successful_responses') or 0),
-            'failed_responses': int(self.redis_client.get('failed_responses') or 0),
-            'average_response_time': float(self.redis_client.get('average_response_time') or 0),
-            'success_rate': self._calculate_success_rate(),
-            'intent_distribution': self._get_intent_distribution(),
-            'common_queries': self._get_common_queries(),
-            'user_satisfaction': self._get_user_satisfaction()
+            'total_conversations': int(conversations or 0),
+            'total_messages': total_messages,
+            'successful_responses': successful_responses,
+            'failed_responses': int(failed or 0),
+            'average_response_time': self._calculate_avg_response_time(float(total_time or 0), total_messages),
+            'success_rate': self._calculate_success_rate(successful_responses, total_messages),
+            'unique_users': int(unique_users or 0),
+            'intent_distribution': self._get_intent_distribution(intent_counts),
+            'common_queries': self._get_common_queries(top_queries),
+            'user_satisfaction': self._get_user_satisfaction(feedback_scores)
         }
 
-    def _calculate_success_rate(self) -> float:
+    @staticmethod
+    def _calculate_success_rate(successful: int, total: int) -> float:
         """Calculate overall success rate"""
-        successful = int(self.redis_client.get('successful_responses') or 0)
-        total = int(self.redis_client.get('total_messages') or 1)
-        return (successful / total) * 100
-
-    def _get_intent_distribution(self) -> Dict:
-        """Get distribution of detected intents"""
-        # This would query your database for intent statistics
-        # For now, return a placeholder
+        return (successful / max(total, 1)) * 100
+
+    @staticmethod
+    def _calculate_avg_response_time(total_time: float, total: int) -> float:
+        """Average response time from the running sum and message count"""
+        return total_time / max(total, 1)
+
+    @staticmethod
+    def _get_intent_distribution(intent_counts: Dict) -> Dict:
+        """Get distribution of detected intents from the intent_counts hash"""
+        return {intent: int(count) for intent, count in (intent_counts or {}).items()}
+
+    @staticmethod
+    def _get_common_queries(top_queries: List) -> List[Dict]:
+        """Get most common user queries from ZREVRANGE ... WITHSCORES rows"""
+        return [{'query': query, 'count': int(score)} for query, score in top_queries or ()]
+
+    @staticmethod
+    def _get_user_satisfaction(feedback_scores: Dict) -> Dict:
+        """Get user satisfaction metrics from the feedback_scores hash of 1-5 ratings"""
+        thumbs_up = thumbs_down = neutral = 0
+        rating_sum = 0
+        for score, count in (feedback_scores or {}).items():
+            score, count = int(score), int(count)
+            rating_sum += score * count
+            if score >= 4:
+                thumbs_up += count
+            elif score <= 2:
+                thumbs_down += count
+            else:
+                neutral += count
+        total = thumbs_up + thumbs_down + neutral
         return {
-            'book_search': 35,
-            'library_hours': 25,
-            'borrowing_info': 20,
-            'policy_query': 15,
-            'other': 5
-        }
-
-    def _get_common_queries(self) -> List[Dict]:
-        """Get most common user queries"""
-        # This would query your database for frequent queries
-        return [
-            {'query': 'What are the library hours?', 'count': 150},
-            {'query': 'How do I borrow a book?', 'count': 120},
-            {'query': 'Find computer science books', 'count': 95},
-            {'query': 'Where is the quiet study area?', 'count': 80},
-            {'query': 'How do I renew a book?', 'count': 75}
-        ]
-
-    def _get_user_satisfaction(self) -> Dict:
-        """Get user satisfaction metrics"""
-        # This would query feedback data
-        return {
-            'thumbs_up': 85,
-            'thumbs_down': 10,
-            'neutral': 5,
-            'average_rating': 4.2
+            'thumbs_up': thumbs_up,
+            'thumbs_down': thumbs_down,
+            'neutral': neutral,
+            'average_rating': rating_sum / total if total else 0.0
         }
 
 
 class EvaluationSystem:
     """Comprehensive evaluation system for the chatbot"""
 
+    _TASK_AUTOMATON = _build_task_automaton()
+
     def __init__(self):
+        # Bounded deques drop the oldest sample in O(1) once full
         self.metrics = {
-            'response_accuracy': [],
-            'response_times': [],
+            'response_accuracy': deque(maxlen=_MAX_EVALUATIONS),
+            'response_times': deque(maxlen=_MAX_EVALUATIONS),
             'task_completion': {},
-            'user_satisfaction': [],
-            'conversation_lengths': [],
-            'fallback_rates': []
+            'user_satisfaction': deque(maxlen=_MAX_EVALUATIONS),
+            'conversation_lengths': deque(maxlen=_MAX_EVALUATIONS),
+            'fallback_rates': deque(maxlen=_MAX_EVALUATIONS)
         }
 
         # Initialize database connection for storing evaluations
-        self.evaluations = []
+        self.evaluations = deque(maxlen=_MAX_EVALUATIONS)
+        # Epoch timestamps parallel to self.evaluations, so period queries can bisect
+        self._evaluation_times = deque(maxlen=_MAX_EVALUATIONS)
+        # False once an evaluation arrives out of time order (e.g. the clock went back)
+        self._evaluations_sorted = True
 
     def evaluate_conversation(self, conversation_id: str,
                               user_feedback: Dict,
@@ -269,20 +462,17 @@ class EvaluationSystem:
         user_requests = system_logs.get('user_requests', [])
         system_responses = system_logs.get('system_responses', [])
 
-        # Define task completion indicators
-        task_indicators = {
-            'book_search': ['found', 'available', 'located', 'search results'],
-            'information_query': ['answer is', 'information', 'details', 'explanation'],
-            'procedural_help': ['steps', 'process', 'procedure', 'how to'],
-            'policy_clarification': ['policy states', 'according to', 'rules', 'guidelines']
-        }
-
+        automaton = self._TASK_AUTOMATON
         for i, (request, response) in enumerate(zip(user_requests, system_responses)):
-            if i < len(system_responses):
-                response_lower = response.lower()
-
-                # Check if response indicates task completion
-                for task_type, indicators in task_indicators.items():
+            response_lower = response.lower()
+
+            # Check if response indicates task completion
+            if automaton is not None:
+                hits = {task_type for _, task_type in automaton.iter(response_lower)}
+                completed_tasks.extend(f"{task_type}_{i}" for task_type in _TASK_INDICATORS
+                                       if task_type in hits)
+            else:
+                for task_type, indicators in _TASK_INDICATORS.items():
                     if any(indicator in response_lower for indicator in indicators):
                         completed_tasks.append(f"{task_type}_{i}")
 
@@ -310,14 +500,12 @@ class EvaluationSystem:
         # Calculate from feedback comments (simple sentiment analysis)
         comments = user_feedback.get('comments', [])
         if comments:
-            # Simple positive word detection
-            positive_words = ['good', 'great', 'excellent', 'helpful', 'thanks', 'thank you', 'useful']
-            negative_words = ['bad', 'poor', 'terrible', 'unhelpful', 'useless', 'waste']
-
-            positive_count = sum(1 for comment in comments
-                               if any(word in comment.lower() for word in positive_words))
-            negative_count = sum(1 for comment in comments
-                               if any(word in comment.lower() for word in negative_words))
+            # Simple positive word detection: one regex search per comment and word list
+            positive_count = negative_count = 0
+            for comment in comments:
+                comment_lower = comment.lower()
+                positive_count += _POSITIVE_RE.search(comment_lower) is not None
+                negative_count += _NEGATIVE_RE.search(comment_lower) is not None
 
             total_comments = len(comments)
             if total_comments > 0:
@@ -358,11 +546,12 @@ class EvaluationSystem:
 
     def _store_evaluation(self, evaluation: Dict):
         """Store evaluation in memory and optionally database"""
+        # Keep only last 1000 evaluations (the deque evicts the oldest)
+        timestamp = datetime.fromisoformat(evaluation['timestamp']).timestamp()
+        if self._evaluation_times and timestamp < self._evaluation_times[-1]:
+            self._evaluations_sorted = False
         self.evaluations.append(evaluation)
-
-        # Keep only last 1000 evaluations
-        if len(self.evaluations) > 1000:
-            self.evaluations = self.evaluations[-1000:]
+        self._evaluation_times.append(timestamp)
 
         # Also update metrics
         metrics = evaluation['metrics']
@@ -374,6 +563,11 @@ class EvaluationSystem:
 
     def _get_evaluations_in_period(self, start_date: datetime, end_date: datetime) -> List[Dict]:
         """Get evaluations within a date period"""
+        if self._evaluations_sorted:
+            times = self._evaluation_times
+            start = bisect_left(times, start_date.timestamp())
+            end = bisect_right(times, end_date.timestamp())
+            return list(islice(self.evaluations, start, end)) if start < end else []
         return [
             eval for eval in self.evaluations
             if start_date <= datetime.fromisoformat(eval['timestamp']) <= end_date
@@ -381,11 +575,8 @@ class EvaluationSystem:
 
     def _average_metric(self, evaluations: List[Dict], metric_name: str) -> float:
         """Calculate average of a metric across evaluations"""
-        values = []
-        for eval in evaluations:
-            metric_value = eval['metrics'].get(metric_name)
-            if metric_value is not None:
-                values.append(metric_value)
+        values = [value for value in (eval['metrics'].get(metric_name) for eval in evaluations)
+                  if value is not None]
 
         return sum(values) / len(values) if values else 0.0
 
@@ -535,14 +726,17 @@ def calculate_response_time_percentiles(response_times: List[float]) -> Dict:
     if not response_times:
         return {}
 
-    sorted_times = sorted(response_times)
+    # Same ranks as indexing the sorted list, but partitioned around them instead of fully sorted
+    times = np.asarray(response_times, dtype=np.float64)
+    ranks = [int(len(times) * q) for q in (0.5, 0.75, 0.90, 0.95, 0.99)]
+    p50, p75, p90, p95, p99 = np.partition(times, ranks)[ranks].tolist()
 
     return {
-        'p50': sorted_times[int(len(sorted_times) * 0.5)],
-        'p75': sorted_times[int(len(sorted_times) * 0.75)],
-        'p90': sorted_times[int(len(sorted_times) * 0.90)],
-        'p95': sorted_times[int(len(sorted_times) * 0.95)],
-        'p99': sorted_times[int(len(sorted_times) * 0.99)]
+        'p50': p50,
+        'p75': p75,
+        'p90': p90,
+        'p95': p95,
+        'p99': p99
     }
 
 
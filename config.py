@@ -4,7 +4,10 @@ Configuration settings for the Intelligent Library Chat Assistant
 
 import os
 from datetime import timedelta
+from functools import lru_cache
+from types import MappingProxyType
 from dotenv import load_dotenv
+from werkzeug.utils import import_string
 
 load_dotenv()
 
@@ -118,3 +121,16 @@ class ProductionConfig(Config):
     # Ensure secret keys are set
     SECRET_KEY = os.getenv('SECRET_KEY', 'prod-secret-key-change-me')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'prod-jwt-secret-key-change-me')
+
+
+@lru_cache(maxsize=None)
+def build_config(config_class):
+    """
+    Resolve a config class (or its dotted import path) into a read-only mapping of its settings.
+    Each class is resolved once per process; pass the result to app.config.from_mapping().
+    """
+    if isinstance(config_class, str):
+        config_class = import_string(config_class)
+    return MappingProxyType({
+        key: getattr(config_class, key) for key in dir(config_class) if key.isupper()
+    })
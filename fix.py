@@ -7,6 +7,11 @@ import json
 import os
 import re
 
+# Bytes 0x80-0x9F, reported as problematic before cleaning
+_C1_BYTE_RE = re.compile(rb'[\x80-\x9f]')
+# Control bytes except tab/LF/CR, plus 0x80-0x9F (never valid UTF-8 lead bytes)
+_STRIP_BYTES = bytes(b for b in range(0x20) if b not in (0x09, 0x0A, 0x0D)) + bytes(range(0x80, 0xA0))
+
 
 def clean_file_encoding(filepath):
     """Clean a single JSON file of invalid UTF-8 bytes"""
@@ -24,7 +29,7 @@ def clean_file_encoding(filepath):
         print(f"   File size: {len(raw_bytes)} bytes")
 
         # Find problematic bytes (0x80-0x9F are invalid in UTF-8)
-        problematic = [i for i, b in enumerate(raw_bytes) if 0x80 <= b <= 0x9F]
+        problematic = [m.start() for m in _C1_BYTE_RE.finditer(raw_bytes)]
         if problematic:
             print(f"   Found {len(problematic)} problematic bytes at positions: {problematic[:10]}...")
 
@@ -37,16 +42,7 @@ def clean_file_encoding(filepath):
                 print(f"   {raw_bytes[start:end]}")
 
         # Remove all control characters (0x00-0x1F except \t, \n, \r) and invalid UTF-8
-        clean_bytes = bytearray()
-        for b in raw_bytes:
-            if b == 0x09 or b == 0x0A or b == 0x0D:  # Keep tab, LF, CR
-                clean_bytes.append(b)
-            elif b < 0x20:  # Remove other control characters
-                continue
-            elif 0x80 <= b <= 0x9F:  # Remove invalid UTF-8 range
-                continue
-            else:
-                clean_bytes.append(b)
+        clean_bytes = raw_bytes.translate(None, _STRIP_BYTES)
 
         # Try to decode as UTF-8
         try: